@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Shared MSAL Token Cache
+Persist service principal tokens between diagnostic script runs so repeat
+invocations reuse a valid token instead of calling Azure AD again
+"""
+
+import os
+import threading
+
+CACHE_PATH = os.path.expanduser("~/.nl2dax_msal_cache.bin")
+
+# Refresh tokens this many seconds before they actually expire
+EXPIRY_MARGIN = 300
+
+def load_cache(path=CACHE_PATH):
+    """Load the on-disk token cache, or an empty one if none exists yet"""
+    # msal pulls in cryptography, so it is only imported once a token is needed
+    import msal
+    
+    cache = msal.SerializableTokenCache()
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                cache.deserialize(f.read())
+        except (OSError, ValueError):
+            # A corrupt or unreadable cache only costs one extra token request
+            pass
+    return cache
+
+def save_cache(cache, path=CACHE_PATH):
+    """Write the token cache back to disk (owner-only) if MSAL changed it"""
+    if not cache.has_state_changed:
+        return
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(cache.serialize())
+    except OSError:
+        pass
+
+PBI_SCOPES = ["https://analysis.windows.net/powerbi/api/.default"]
+FABRIC_SCOPES = ["https://api.fabric.microsoft.com/.default"]
+
+_app = None
+_cache = None
+
+# Serializes token lookups so concurrent callers share one Azure AD request
+_lock = threading.Lock()
+
+def get_cached_app():
+    """Build the service principal app once per process, backed by the disk cache"""
+    global _app, _cache
+    if _app is None:
+        import msal
+        _cache = load_cache()
+        _app = msal.ConfidentialClientApplication(
+            client_id=os.getenv("PBI_CLIENT_ID"),
+            client_credential=os.getenv("PBI_CLIENT_SECRET"),
+            authority=f"https://login.microsoftonline.com/{os.getenv('PBI_TENANT_ID')}",
+            token_cache=_cache
+        )
+    return _app
+
+def get_token(scopes):
+    """Return the MSAL result for scopes, hitting Azure AD only on a cache miss"""
+    with _lock:
+        app = get_cached_app()
+        result = app.acquire_token_silent(scopes, account=None)
+        if not result:
+            result = app.acquire_token_for_client(scopes=scopes)
+        save_cache(_cache)
+    return result
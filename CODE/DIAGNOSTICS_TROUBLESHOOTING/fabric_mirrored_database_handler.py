@@ -5,6 +5,8 @@ Handle DAX queries against Fabric mirrored Azure SQL databases
 """
 
 import os
+import socket
+import threading
 import requests
 import msal
 import json
@@ -13,6 +15,22 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Hosts contacted during a run; resolved up front so the first request to
+# each one does not pay the DNS round-trip
+PREWARM_HOSTS = (
+    "api.powerbi.com",
+    "api.fabric.microsoft.com",
+    "login.microsoftonline.com",
+)
+
+def prewarm_dns(hosts=PREWARM_HOSTS):
+    """Resolve API hosts once to populate the OS resolver cache"""
+    for host in hosts:
+        try:
+            socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+        except OSError:
+            pass
+
 class FabricMirroredDatabaseHandler:
     """Handle Fabric mirrored database semantic models"""
     
@@ -25,6 +43,9 @@ class FabricMirroredDatabaseHandler:
         self.token = None
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # Resolve hosts in the background so it overlaps with MSAL setup
+        threading.Thread(target=prewarm_dns, daemon=True).start()
+        
     def get_token(self):
         """Get Azure AD token"""
         try:
@@ -48,6 +69,16 @@ class FabricMirroredDatabaseHandler:
             print(f"❌ Token error: {e}")
             return False
     
+    def post_json(self, url, payload, timeout=30):
+        """POST a pre-encoded JSON body with an explicit Content-Length"""
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Content-Length": str(len(body)),
+        }
+        return requests.post(url, data=body, headers=headers, timeout=timeout)
+    
     def check_fabric_semantic_model_status(self):
         """Check the status of the Fabric semantic model"""
         headers = {"Authorization": f"Bearer {self.token}"}
@@ -132,11 +163,6 @@ class FabricMirroredDatabaseHandler:
     
     def try_sql_style_queries(self):
         """Try SQL-style queries which might work better with mirrored databases"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         print("🔍 SQL-STYLE QUERY TESTS")
         print("-" * 40)
         print("Mirrored databases might support SQL queries better than DAX")
@@ -162,7 +188,7 @@ class FabricMirroredDatabaseHandler:
             }
             
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self.post_json(url, payload)
                 print(f"Status: {response.status_code}")
                 
                 if response.status_code == 200:
@@ -197,11 +223,6 @@ class FabricMirroredDatabaseHandler:
     
     def try_fabric_dax_queries(self):
         """Try DAX queries specifically designed for Fabric mirrored databases"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         print("🔍 FABRIC-SPECIFIC DAX QUERIES")
         print("-" * 40)
         print("Try DAX patterns that work with Fabric semantic models")
@@ -227,7 +248,7 @@ class FabricMirroredDatabaseHandler:
             }
             
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self.post_json(url, payload)
                 print(f"Status: {response.status_code}")
                 
                 if response.status_code == 200:
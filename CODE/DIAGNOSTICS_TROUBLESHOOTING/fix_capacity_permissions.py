@@ -6,14 +6,24 @@ Focus on resolving 404 capacity access and permission issues
 
 import os
 import requests
-import msal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, buffered_output, json_loads, short_body
+
 load_dotenv()
 
+def close_response(future):
+    """Done-callback that closes a finished request's streamed response"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
 class CapacityAndPermissionsFixer:
     """Fix capacity access and dataset permissions issues"""
     
@@ -24,22 +34,52 @@ class CapacityAndPermissionsFixer:
         self.workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
         self.dataset_id = os.getenv("POWERBI_DATASET_ID", "fc4d80c8-090e-4441-8336-217490bde820")
         self.token = None
+        self.token_expires_at = 0
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # URLs and request bodies are fixed for the run, so build them once
+        self.workspace_url = f"{self.base_url}/groups/{self.workspace_id}"
+        self.ds_url = f"{self.workspace_url}/datasets/{self.dataset_id}"
+        self.execute_url = f"{self.ds_url}/executeQueries"
+        self.probe_body = json.dumps({
+            "queries": [{"query": "EVALUATE { 1 }"}],
+            "serializerSettings": {"includeNulls": True}
+        }).encode("utf-8")
+        self.simple_probe_body = json.dumps({
+            "queries": [{"query": "EVALUATE { 1 }"}]
+        }).encode("utf-8")
+        
+        # One pooled session so every call reuses the same keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504],
+                # Hand the final 429/5xx back so the status-code branches can report it
+                raise_on_status=False
+            )
+        )
+        self.session.mount("https://api.powerbi.com", adapter)
+        self.session.mount("https://api.fabric.microsoft.com", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        # Bodies are only downloaded when read, so error paths can stop early
+        self.session.stream = True
+        
     def get_token(self):
         """Get Azure AD token"""
+        # Current token is still good; skip the Azure AD call
+        if self.token and time.time() < self.token_expires_at:
+            return True
+        
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Served from the persisted cache while the previous token is valid
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.token_expires_at = time.time() + result.get("expires_in", 0) - auth_cache.EXPIRY_MARGIN
+                self.session.headers.update({"Authorization": f"Bearer {self.token}"})
                 return True
             else:
                 print(f"❌ Token failed: {result.get('error_description', 'Unknown')}")
@@ -49,31 +89,55 @@ class CapacityAndPermissionsFixer:
             print(f"❌ Token error: {e}")
             return False
     
-    def check_capacity_via_multiple_apis(self, capacity_id):
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def get_concurrently(self, *urls):
+        """Start independent GETs in parallel; returns futures in request order"""
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        futures = [executor.submit(self.session.get, url, timeout=30) for url in urls]
+        executor.shutdown(wait=False)
+        return futures
+    
+    def start_capacity_lookups(self, capacity_id):
+        """Start the capacity GETs without waiting for them"""
+        # The three lookups are independent, so issue them together and
+        # report the results in order
+        return self.get_concurrently(
+            f"{self.base_url}/capacities/{capacity_id}",
+            f"{self.base_url}/capacities",
+            f"https://api.fabric.microsoft.com/v1/capacities/{capacity_id}"
+        )
+    
+    @buffered_output
+    def check_capacity_via_multiple_apis(self, capacity_id, lookups=None):
         """Check capacity using multiple API endpoints"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print(f"🔍 CAPACITY CHECK: {capacity_id}")
         print("-" * 50)
         
+        capacity_future, capacities_future, fabric_future = lookups or self.start_capacity_lookups(capacity_id)
+        
         # Method 1: Power BI capacities endpoint
         print("1️⃣ Power BI Capacities API:")
         try:
-            response = requests.get(
-                f"{self.base_url}/capacities/{capacity_id}",
-                headers=headers,
-                timeout=30
-            )
+            response = capacity_future.result()
             print(f"   Status: {response.status_code}")
             if response.status_code == 200:
-                capacity = response.json()
+                capacity = json_loads(response.content)
                 print(f"   ✅ Display name: {capacity.get('displayName', 'Unknown')}")
                 print(f"   ✅ Admins: {len(capacity.get('admins', []))}")
                 print(f"   ✅ State: {capacity.get('state', 'Unknown')}")
             elif response.status_code == 404:
                 print("   ❌ 404 - Capacity not found or no access")
             else:
-                print(f"   ❌ Error: {response.text[:200]}")
+                print(f"   ❌ Error: {short_body(response)}")
         except Exception as e:
             print(f"   ❌ Exception: {e}")
         
@@ -82,14 +146,10 @@ class CapacityAndPermissionsFixer:
         # Method 2: List all accessible capacities
         print("2️⃣ List All Accessible Capacities:")
         try:
-            response = requests.get(
-                f"{self.base_url}/capacities",
-                headers=headers,
-                timeout=30
-            )
+            response = capacities_future.result()
             print(f"   Status: {response.status_code}")
             if response.status_code == 200:
-                capacities = response.json().get('value', [])
+                capacities = json_loads(response.content).get('value', [])
                 print(f"   ✅ Found {len(capacities)} accessible capacities")
                 
                 target_found = False
@@ -108,7 +168,7 @@ class CapacityAndPermissionsFixer:
                     for cap in capacities[:3]:  # Show first 3
                         print(f"      - {cap.get('displayName', 'Unknown')} ({cap['id']})")
             else:
-                print(f"   ❌ Error: {response.text[:200]}")
+                print(f"   ❌ Error: {short_body(response)}")
         except Exception as e:
             print(f"   ❌ Exception: {e}")
         
@@ -118,12 +178,11 @@ class CapacityAndPermissionsFixer:
         print("3️⃣ Fabric Capacities API:")
         try:
             # Try with current token first
-            fabric_url = f"https://api.fabric.microsoft.com/v1/capacities/{capacity_id}"
-            response = requests.get(fabric_url, headers=headers, timeout=30)
+            response = fabric_future.result()
             print(f"   Status: {response.status_code}")
             
             if response.status_code == 200:
-                capacity = response.json()
+                capacity = json_loads(response.content)
                 print(f"   ✅ Display name: {capacity.get('displayName', 'Unknown')}")
                 print(f"   ✅ State: {capacity.get('state', 'Unknown')}")
                 print(f"   ✅ SKU: {capacity.get('sku', 'Unknown')}")
@@ -133,38 +192,43 @@ class CapacityAndPermissionsFixer:
             elif response.status_code == 404:
                 print("   ❌ 404 - Capacity not found in Fabric API")
             else:
-                print(f"   ❌ Error: {response.text[:200]}")
+                print(f"   ❌ Error: {short_body(response)}")
         except Exception as e:
             print(f"   ❌ Exception: {e}")
         
         print()
     
-    def check_dataset_detailed_permissions(self):
+    def start_permission_lookups(self):
+        """Start the dataset/workspace permission GETs without waiting for them"""
+        return self.get_concurrently(
+            f"{self.ds_url}/users",
+            self.ds_url,
+            f"{self.workspace_url}/users"
+        )
+    
+    @buffered_output
+    def check_dataset_detailed_permissions(self, lookups=None):
         """Check detailed dataset permissions and access patterns"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("🔐 DETAILED DATASET PERMISSIONS CHECK")
         print("-" * 50)
         
+        users_future, dataset_future, workspace_users_future = lookups or self.start_permission_lookups()
+        
         # Check dataset users/permissions
         print("1️⃣ Dataset Users:")
         try:
-            response = requests.get(
-                f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/users",
-                headers=headers,
-                timeout=30
-            )
+            response = users_future.result()
             print(f"   Status: {response.status_code}")
             
             if response.status_code == 200:
-                users = response.json().get('value', [])
+                users = json_loads(response.content).get('value', [])
                 print(f"   ✅ Found {len(users)} users/permissions")
                 for user in users:
                     print(f"      - {user.get('emailAddress', 'Unknown')} ({user.get('datasetUserAccessRight', 'Unknown')})")
             elif response.status_code == 404:
                 print("   ❌ 404 - Cannot access dataset users (may be expected)")
             else:
-                print(f"   ❌ Error: {response.text[:200]}")
+                print(f"   ❌ Error: {short_body(response)}")
         except Exception as e:
             print(f"   ❌ Exception: {e}")
         
@@ -173,14 +237,10 @@ class CapacityAndPermissionsFixer:
         # Check if dataset supports executeQueries
         print("2️⃣ Dataset Capabilities:")
         try:
-            response = requests.get(
-                f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}",
-                headers=headers,
-                timeout=30
-            )
+            response = dataset_future.result()
             
             if response.status_code == 200:
-                dataset = response.json()
+                dataset = json_loads(response.content)
                 print("   ✅ Dataset properties:")
                 print(f"      Name: {dataset.get('name', 'Unknown')}")
                 print(f"      Configured by: {dataset.get('configuredBy', 'Unknown')}")
@@ -206,15 +266,11 @@ class CapacityAndPermissionsFixer:
         # Check workspace users/permissions
         print("3️⃣ Workspace Users:")
         try:
-            response = requests.get(
-                f"{self.base_url}/groups/{self.workspace_id}/users",
-                headers=headers,
-                timeout=30
-            )
+            response = workspace_users_future.result()
             print(f"   Status: {response.status_code}")
             
             if response.status_code == 200:
-                users = response.json().get('value', [])
+                users = json_loads(response.content).get('value', [])
                 print(f"   ✅ Found {len(users)} workspace users")
                 
                 # Look for our service principal
@@ -228,84 +284,72 @@ class CapacityAndPermissionsFixer:
                 if not service_principal_found:
                     print("   ⚠️  Service principal not found in workspace users")
             else:
-                print(f"   ❌ Error: {response.text[:200]}")
+                print(f"   ❌ Error: {short_body(response)}")
         except Exception as e:
             print(f"   ❌ Exception: {e}")
         
         print()
     
+    @buffered_output
     def test_alternative_query_methods(self):
         """Test alternative ways to execute queries"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         print("🧪 ALTERNATIVE QUERY METHODS TEST")
         print("-" * 50)
         
-        # Method 1: Try without workspace (direct dataset access)
-        print("1️⃣ Direct Dataset Access (without workspace):")
-        url = f"{self.base_url}/datasets/{self.dataset_id}/executeQueries"
-        payload = {
-            "queries": [{"query": "EVALUATE { 1 }"}],
-            "serializerSettings": {"includeNulls": True}
-        }
+        dataset_url = f"{self.base_url}/datasets/{self.dataset_id}/executeQueries"
         
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            print(f"   Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                print("   ✅ SUCCESS with direct dataset access!")
-                return True
-            else:
-                print(f"   ❌ Failed: {response.text[:100]}")
-        except Exception as e:
-            print(f"   ❌ Exception: {e}")
+        # Add user context header (merged with the session's Authorization header)
+        headers_with_context = {"X-PowerBI-User": f"app:{self.client_id}"}
         
-        print()
+        # (label, success description, url, body, extra headers)
+        methods = [
+            # Method 1: Try without workspace (direct dataset access)
+            ("1️⃣ Direct Dataset Access (without workspace):", "direct dataset access", dataset_url, self.probe_body, None),
+            # Method 2: Try with different payload structure
+            ("2️⃣ Simplified Payload Structure:", "simplified payload", self.execute_url, self.simple_probe_body, None),
+            # Method 3: Try with explicit impersonation (if needed)
+            ("3️⃣ With Service Principal Context:", "service principal context", self.execute_url, self.probe_body, headers_with_context),
+        ]
         
-        # Method 2: Try with different payload structure
-        print("2️⃣ Simplified Payload Structure:")
-        url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
-        simple_payload = {
-            "queries": [{"query": "EVALUATE { 1 }"}]
-        }
+        # The probes are independent, so fire them together and take the first success
+        executor = ThreadPoolExecutor(max_workers=len(methods))
+        futures = {}
+        for method in methods:
+            _, _, url, body, headers = method
+            futures[executor.submit(self.session.post, url, data=body, headers=headers, timeout=30)] = method
+        executor.shutdown(wait=False)
         
+        outcomes = {}
         try:
-            response = requests.post(url, headers=headers, json=simple_payload, timeout=30)
-            print(f"   Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                print("   ✅ SUCCESS with simplified payload!")
-                return True
-            else:
-                print(f"   ❌ Failed: {response.text[:100]}")
-        except Exception as e:
-            print(f"   ❌ Exception: {e}")
-        
-        print()
-        
-        # Method 3: Try with explicit impersonation (if needed)
-        print("3️⃣ With Service Principal Context:")
-        url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
+            for future in as_completed(futures):
+                label, description, *_ = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    outcomes[label] = [f"   ❌ Exception: {e}"]
+                    continue
+                
+                if response.status_code == 200:
+                    print(label)
+                    print(f"   Status: {response.status_code}")
+                    print(f"   ✅ SUCCESS with {description}!")
+                    return True
+                outcomes[label] = [
+                    f"   Status: {response.status_code}",
+                    f"   ❌ Failed: {short_body(response, 100)}"
+                ]
+        finally:
+            # The session streams bodies, so release every probe's pooled
+            # connection, including ones still running after an early success
+            for future in futures:
+                future.add_done_callback(close_response)
         
-        # Add user context header
-        headers_with_context = headers.copy()
-        headers_with_context["X-PowerBI-User"] = f"app:{self.client_id}"
-        
-        try:
-            response = requests.post(url, headers=headers_with_context, json=payload, timeout=30)
-            print(f"   Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                print("   ✅ SUCCESS with service principal context!")
-                return True
-            else:
-                print(f"   ❌ Failed: {response.text[:100]}")
-        except Exception as e:
-            print(f"   ❌ Exception: {e}")
+        # Nothing worked; report every method in its original order
+        for label, *_ in methods:
+            print(label)
+            for line in outcomes[label]:
+                print(line)
+            print()
         
         return False
 
@@ -313,71 +357,87 @@ def main():
     """Main capacity and permissions fixing function"""
     print("🔧 CAPACITY ACCESS & DATASET PERMISSIONS FIXER")
     print("=" * 60)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Fix 404 capacity access and dataset permission issues")
     print()
     
-    fixer = CapacityAndPermissionsFixer()
-    
-    if not fixer.get_token():
-        print("❌ Cannot proceed without token")
-        return 1
+    with CapacityAndPermissionsFixer() as fixer:
+        if not fixer.get_token():
+            print("❌ Cannot proceed without token")
+            return 1
     
-    print("✅ Authentication successful")
-    print()
+        print("✅ Authentication successful")
+        print()
     
-    # Get workspace to find capacity ID
-    headers = {"Authorization": f"Bearer {fixer.token}"}
-    try:
-        response = requests.get(
-            f"{fixer.base_url}/groups/{fixer.workspace_id}",
-            headers=headers,
-            timeout=30
-        )
+        # With a capacity hint the capacity lookups can run alongside the
+        # workspace GET instead of waiting for it
+        capacity_id_hint = os.getenv("POWERBI_CAPACITY_ID")
+        capacity_lookups = fixer.start_capacity_lookups(capacity_id_hint) if capacity_id_hint else None
+        # Hint lookups that never reach the capacity check; their streamed
+        # responses are closed in the finally block
+        unused_lookups = capacity_lookups
+        
+        # Get workspace to find capacity ID
+        try:
+            response = fixer.session.get(
+                fixer.workspace_url,
+                timeout=30
+            )
         
-        if response.status_code == 200:
-            workspace = response.json()
-            capacity_id = workspace.get('capacityId')
+            if response.status_code == 200:
+                workspace = json_loads(response.content)
+                capacity_id = workspace.get('capacityId')
             
-            if capacity_id:
-                # Check capacity via multiple methods
-                fixer.check_capacity_via_multiple_apis(capacity_id)
+                if capacity_id:
+                    # Dataset permissions don't depend on the capacity, so
+                    # fetch them while the capacity results are reported
+                    permission_lookups = fixer.start_permission_lookups()
+                    if capacity_id_hint and capacity_id_hint.lower() == capacity_id.lower():
+                        unused_lookups = None
+                    else:
+                        capacity_lookups = None
+                    
+                    # Check capacity via multiple methods
+                    fixer.check_capacity_via_multiple_apis(capacity_id, capacity_lookups)
+                else:
+                    print("❌ No capacity assigned to workspace")
+                    return 1
             else:
-                print("❌ No capacity assigned to workspace")
+                print(f"❌ Cannot get workspace details: {response.status_code}")
                 return 1
-        else:
-            print(f"❌ Cannot get workspace details: {response.status_code}")
-            return 1
             
-    except Exception as e:
-        print(f"❌ Workspace error: {e}")
-        return 1
+        except Exception as e:
+            print(f"❌ Workspace error: {e}")
+            return 1
+        finally:
+            for future in unused_lookups or ():
+                future.add_done_callback(close_response)
     
-    # Check detailed dataset permissions
-    fixer.check_dataset_detailed_permissions()
+        # Check detailed dataset permissions
+        fixer.check_dataset_detailed_permissions(permission_lookups)
     
-    # Test alternative query methods
-    success = fixer.test_alternative_query_methods()
+        # Test alternative query methods
+        success = fixer.test_alternative_query_methods()
     
-    print("📊 SUMMARY & RECOMMENDATIONS")
-    print("=" * 40)
+        print("📊 SUMMARY & RECOMMENDATIONS")
+        print("=" * 40)
     
-    if success:
-        print("🎉 SUCCESS! Found working query method")
-        print("   Update your scripts to use the successful method")
-    else:
-        print("❌ All query methods failed")
-        print("   🔧 Recommendations:")
-        print("   1. Verify service principal is added to workspace with appropriate permissions")
-        print("   2. Check if dataset is in Import mode (not DirectQuery)")
-        print("   3. Ensure capacity is fully active and not paused")
-        print("   4. Contact Power BI administrator to verify tenant settings")
-        print("   5. Check if 'Service principals can use Power BI APIs' is enabled")
+        if success:
+            print("🎉 SUCCESS! Found working query method")
+            print("   Update your scripts to use the successful method")
+        else:
+            print("❌ All query methods failed")
+            print("   🔧 Recommendations:")
+            print("   1. Verify service principal is added to workspace with appropriate permissions")
+            print("   2. Check if dataset is in Import mode (not DirectQuery)")
+            print("   3. Ensure capacity is fully active and not paused")
+            print("   4. Contact Power BI administrator to verify tenant settings")
+            print("   5. Check if 'Service principals can use Power BI APIs' is enabled")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
-    return 0 if success else 1
+        return 0 if success else 1
 
 if __name__ == "__main__":
     exit(main())
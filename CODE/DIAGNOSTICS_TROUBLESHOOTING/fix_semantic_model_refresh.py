@@ -5,15 +5,41 @@ Trigger refresh without invalid parameters for service principal
 """
 
 import os
+import re
 import requests
-import msal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, buffered_output, json_loads, short_body
+
 load_dotenv()
 
+# Refresh polling schedule: 2s, 4s, 8s ... capped at 60s, ten polls (~6 minutes)
+MAX_POLL_ATTEMPTS = 10
+POLL_MAX_DELAY = 60
+MAX_PROBES_IN_FLIGHT = 4
+
+def poll_delay(attempt):
+    """Seconds to wait before the given 1-based poll"""
+    return min(POLL_MAX_DELAY, 2 ** attempt)
+
+def rejected_parameters(error, keys):
+    """Refresh parameters an InvalidRequest error names, by target or as a quoted word"""
+    targets = {error.get('target')}
+    targets.update(detail.get('target') for detail in error.get('details') or [] if isinstance(detail, dict))
+    message = str(error.get('message', ''))
+    # Only a quoted mention counts, so "type mismatch" or "Content-Type" doesn't reject 'type'
+    return {
+        key for key in keys
+        if key in targets or re.search(rf"[\"'`]{re.escape(key)}[\"'`]", message)
+    }
+
 class FabricSemanticModelRefresh:
     """Fix semantic model refresh for service principal"""
     
@@ -24,22 +50,55 @@ class FabricSemanticModelRefresh:
         self.workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
         self.dataset_id = os.getenv("POWERBI_DATASET_ID", "fc4d80c8-090e-4441-8336-217490bde820")
         self.token = None
+        self.token_expires_at = 0
+        self.refresh_request_id = None
+        self.refresh_auth_error = None
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # URLs and request bodies are fixed for the run, so build them once
+        self.ds_url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}"
+        self.execute_url = f"{self.ds_url}/executeQueries"
+        self.refresh_url = f"{self.ds_url}/refreshes"
+        self.probe_body = json.dumps({
+            "queries": [{"query": "EVALUATE { 1 }"}],
+            "serializerSettings": {"includeNulls": True}
+        }).encode("utf-8")
+        self.info_tables_body = json.dumps({
+            "queries": [{"query": "EVALUATE INFO.TABLES()"}],
+            "serializerSettings": {"includeNulls": True}
+        }).encode("utf-8")
+        
+        # One pooled session so every call reuses the same keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504],
+                # Hand the final 429/5xx back so the status-code branches can report it
+                raise_on_status=False
+            )
+        )
+        self.session.mount("https://api.powerbi.com", adapter)
+        self.session.mount("https://api.fabric.microsoft.com", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        # Bodies are only downloaded when read, so error paths can stop early
+        self.session.stream = True
+        
     def get_token(self):
         """Get token"""
+        # Current token is still good; skip the Azure AD call
+        if self.token and time.time() < self.token_expires_at:
+            return True
+        
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Served from the persisted cache while the previous token is valid
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.token_expires_at = time.time() + result.get("expires_in", 0) - auth_cache.EXPIRY_MARGIN
+                self.session.headers.update({"Authorization": f"Bearer {self.token}"})
                 return True
             else:
                 print(f"❌ Token failed: {result.get('error_description', 'Unknown')}")
@@ -49,13 +108,19 @@ class FabricSemanticModelRefresh:
             print(f"❌ Token error: {e}")
             return False
     
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    @buffered_output
     def trigger_refresh_simple(self):
         """Trigger refresh with minimal parameters for service principal"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         print("🔄 TRIGGERING SEMANTIC MODEL REFRESH (FIXED)")
         print("-" * 50)
         
@@ -66,14 +131,22 @@ class FabricSemanticModelRefresh:
             ("Enhanced refresh", {"type": "full"}),
         ]
         
+        # Parameters the service has called out as invalid; later attempts
+        # that send them again are skipped
+        rejected_params = set()
+        
         for approach_name, payload in refresh_payloads:
+            if rejected_params & payload.keys():
+                print(f"Skipping: {approach_name} (parameter already rejected)")
+                print()
+                continue
+            
             print(f"Trying: {approach_name}")
             print(f"Payload: {payload}")
             
             try:
-                response = requests.post(
-                    f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/refreshes",
-                    headers=headers,
+                response = self.session.post(
+                    self.refresh_url,
                     json=payload,
                     timeout=30
                 )
@@ -81,14 +154,27 @@ class FabricSemanticModelRefresh:
                 print(f"Status: {response.status_code}")
                 
                 if response.status_code == 202:
+                    # Remember which refresh we started so polling can match it
+                    self.refresh_request_id = response.headers.get("RequestId")
                     print("✅ Refresh triggered successfully!")
                     print("   The semantic model will be refreshed asynchronously")
                     return True
+                elif response.status_code in (401, 403):
+                    # A different payload won't fix an authorization problem
+                    self.refresh_auth_error = response.status_code
+                    print("❌ Not authorized to refresh this semantic model")
+                    print(f"   Error: {short_body(response)}")
+                    return False
                 elif response.status_code == 400:
                     print("❌ Refresh request failed")
                     try:
-                        error_data = response.json()
-                        print(f"   Error: {error_data.get('error', {}).get('message', 'Unknown')}")
+                        error = json_loads(response.content).get('error', {})
+                        message = error.get('message', 'Unknown')
+                        print(f"   Error: {message}")
+                        if str(error.get('code', '')).lower() == 'invalidrequest':
+                            rejected_params.update(rejected_parameters(
+                                error, {key for _, attempt in refresh_payloads for key in attempt}
+                            ))
                     except:
                         print(f"   Raw error: {response.text}")
                 elif response.status_code == 409:
@@ -110,89 +196,145 @@ class FabricSemanticModelRefresh:
         print("⏳ WAITING FOR REFRESH AND TESTING")
         print("-" * 40)
         
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
-        url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
-        
-        # Wait and test periodically
-        for attempt in range(1, 11):  # Try 10 times over ~5 minutes
-            print(f"Attempt {attempt}/10 (waiting {attempt * 30}s)...")
-            
-            time.sleep(30)  # Wait 30 seconds
-            
-            # Test simple DAX query
-            payload = {
-                "queries": [{"query": "EVALUATE { 1 }"}],
-                "serializerSettings": {"includeNulls": True}
-            }
-            
-            try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
-                print(f"   DAX test status: {response.status_code}")
+        # Poll the refresh status with exponential backoff and, once it is no
+        # longer running, start a DAX probe on each poll without waiting for the
+        # previous one; the first probe to come back 200 wins
+        start = time.monotonic()
+        attempt = 1
+        next_tick = start + poll_delay(attempt)
+        in_flight = set()
+        executor = ThreadPoolExecutor(max_workers=MAX_PROBES_IN_FLIGHT)
+        try:
+            while True:
+                elapsed = time.monotonic() - start
+                probing = attempt <= MAX_POLL_ATTEMPTS
                 
-                if response.status_code == 200:
-                    print("   ✅ SUCCESS! DAX queries are now working!")
+                if probing and time.monotonic() >= next_tick:
+                    print(f"Attempt {attempt}/{MAX_POLL_ATTEMPTS} ({elapsed:.0f}s elapsed)...")
+                    attempt += 1
+                    next_tick += poll_delay(attempt)
+                    probing = attempt <= MAX_POLL_ATTEMPTS
                     
-                    # Test INFO.TABLES to see actual tables
-                    info_payload = {
-                        "queries": [{"query": "EVALUATE INFO.TABLES()"}],
-                        "serializerSettings": {"includeNulls": True}
-                    }
+                    # Long waits can outlive the token; this is a no-op while it is valid
+                    self.get_token()
                     
-                    info_response = requests.post(url, headers=headers, json=info_payload, timeout=30)
-                    if info_response.status_code == 200:
-                        data = info_response.json()
-                        if data.get('results') and data['results'][0].get('tables'):
-                            table = data['results'][0]['tables'][0]
-                            rows = table.get('rows', [])
-                            print(f"   📊 Found {len(rows)} tables in the semantic model!")
-                            
-                            # Show first few table names
-                            for i, row in enumerate(rows[:5], 1):
-                                table_name = row[0] if row else 'Unknown'
-                                print(f"      {i}. {table_name}")
-                            
-                            if len(rows) > 5:
-                                print(f"      ... and {len(rows) - 5} more tables")
-                    
-                    return True
-                else:
+                    status = self.get_latest_refresh_status()
+                    if status in ("Failed", "Disabled"):
+                        print(f"   ❌ Refresh status: {status}")
+                        return False
+                    if status in ("Unknown", "InProgress", "NotStarted"):
+                        print(f"   ⏳ [{elapsed:.0f}s] Refresh status: {status}")
+                    elif len(in_flight) < MAX_PROBES_IN_FLIGHT:
+                        print(f"   🔎 [{elapsed:.0f}s] Sending DAX probe ({len(in_flight) + 1} in flight)")
+                        in_flight.add(executor.submit(
+                            self.session.post, self.execute_url, data=self.probe_body, timeout=30
+                        ))
+                
+                if not probing and not in_flight:
+                    break
+                
+                # Sleep until the next tick, waking early if a probe finishes
+                timeout = max(0, next_tick - time.monotonic()) if probing else None
+                if not in_flight:
+                    time.sleep(timeout)
+                    continue
+                done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
                     try:
-                        error_data = response.json()
-                        error_details = error_data.get('error', {}).get('pbi.error', {}).get('details', [])
-                        if error_details:
-                            detail = error_details[0].get('detail', {}).get('value', 'No detail')
-                            if "at least one tables" in detail:
-                                print(f"   ❌ Still no tables: {detail}")
-                            else:
-                                print(f"   ❌ Different error: {detail}")
-                        else:
-                            print(f"   ❌ Error: {response.text[:100]}")
-                    except:
-                        print(f"   ❌ Error: {response.text[:100]}")
-                        
-            except Exception as e:
-                print(f"   ❌ Exception: {e}")
+                        if self.report_probe(future.result()):
+                            return True
+                    except Exception as e:
+                        print(f"   ❌ Exception: {e}")
+        finally:
+            # Abandon probes that are still running once one has succeeded, but
+            # close their streamed responses when they land so the pooled
+            # connections are released
+            for future in in_flight:
+                future.add_done_callback(
+                    lambda f: f.cancelled() or f.exception() is not None or f.result().close()
+                )
+            executor.shutdown(wait=False, cancel_futures=True)
         
         print("⏰ Timeout - refresh may take longer")
         return False
     
+    def report_probe(self, response):
+        """Print the outcome of a DAX probe and return True if it succeeded"""
+        print(f"   DAX test status: {response.status_code}")
+        
+        if response.status_code == 200:
+            print("   ✅ SUCCESS! DAX queries are now working!")
+            
+            # Test INFO.TABLES to see actual tables
+            info_response = self.session.post(self.execute_url, data=self.info_tables_body, timeout=30)
+            if info_response.status_code == 200:
+                data = json_loads(info_response.content)
+                if data.get('results') and data['results'][0].get('tables'):
+                    table = data['results'][0]['tables'][0]
+                    rows = table.get('rows', [])
+                    print(f"   📊 Found {len(rows)} tables in the semantic model!")
+                    
+                    # Show first few table names
+                    for i, row in enumerate(rows[:5], 1):
+                        table_name = row[0] if row else 'Unknown'
+                        print(f"      {i}. {table_name}")
+                    
+                    if len(rows) > 5:
+                        print(f"      ... and {len(rows) - 5} more tables")
+            
+            return True
+        
+        try:
+            error_data = json_loads(response.content)
+            error_details = error_data.get('error', {}).get('pbi.error', {}).get('details', [])
+            if error_details:
+                detail = error_details[0].get('detail', {}).get('value', 'No detail')
+                if "at least one tables" in detail:
+                    print(f"   ❌ Still no tables: {detail}")
+                else:
+                    print(f"   ❌ Different error: {detail}")
+            else:
+                print(f"   ❌ Error: {short_body(response, 100)}")
+        except:
+            print(f"   ❌ Error: {short_body(response, 100)}")
+        return False
+    
+    def get_latest_refresh_status(self):
+        """Return the status of the most recent refresh, or None if unavailable"""
+        try:
+            response = self.session.get(
+                self.refresh_url,
+                params={"$top": 1},
+                timeout=30
+            )
+            if response.status_code != 200:
+                return None
+            
+            refreshes = json_loads(response.content).get('value', [])
+            if not refreshes:
+                return None
+            
+            latest = refreshes[0]
+            # The refresh we triggered is not listed yet
+            if self.refresh_request_id and latest.get('requestId') != self.refresh_request_id:
+                return "NotStarted"
+            return latest.get('status', 'Unknown')
+            
+        except Exception:
+            return None
+    
+    @buffered_output
     def check_refresh_status(self):
         """Check current refresh status"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         try:
-            response = requests.get(
-                f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/refreshes",
-                headers=headers,
+            response = self.session.get(
+                self.refresh_url,
+                params={"$top": 1},
                 timeout=30
             )
             
             if response.status_code == 200:
-                refreshes = response.json().get('value', [])
+                refreshes = json_loads(response.content).get('value', [])
                 
                 if refreshes:
                     latest = refreshes[0]
@@ -218,69 +360,70 @@ def main():
     """Main refresh fixing function"""
     print("🔧 FABRIC SEMANTIC MODEL REFRESH FIX")
     print("=" * 40)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Fix semantic model refresh for service principal")
     print("🎯 Issue: Semantic model never refreshed, tables not accessible")
     print()
     
-    refresher = FabricSemanticModelRefresh()
-    
-    if not refresher.get_token():
-        print("❌ Cannot proceed without token")
-        return 1
-    
-    print("✅ Authentication successful")
-    print()
+    with FabricSemanticModelRefresh() as refresher:
+        if not refresher.get_token():
+            print("❌ Cannot proceed without token")
+            return 1
     
-    # Check current status
-    current_status = refresher.check_refresh_status()
-    print()
+        print("✅ Authentication successful")
+        print()
     
-    # Trigger refresh
-    refresh_triggered = refresher.trigger_refresh_simple()
-    print()
+        # Check current status
+        current_status = refresher.check_refresh_status()
+        print()
     
-    if refresh_triggered:
-        print("✅ Refresh triggered! Now waiting and testing...")
-        success = refresher.wait_and_test()
-    else:
-        print("❌ Could not trigger refresh")
-        success = False
+        # Trigger refresh
+        refresh_triggered = refresher.trigger_refresh_simple()
+        print()
     
-    print()
-    print("📊 FINAL RESULTS")
-    print("=" * 20)
+        if refresh_triggered:
+            print("✅ Refresh triggered! Now waiting and testing...")
+            success = refresher.wait_and_test()
+        else:
+            print("❌ Could not trigger refresh")
+            if refresher.refresh_auth_error:
+                print(f"   Refresh was rejected with {refresher.refresh_auth_error}: check the service principal's dataset permissions")
+            success = False
     
-    if success:
-        print("🎉 SUCCESS! Fabric mirrored database is now working!")
-        print("   ✅ Semantic model has been refreshed")
-        print("   ✅ Tables are now accessible via DAX queries")
-        print("   ✅ Your NL2DAX application should now work")
-        print()
-        print("🔧 NEXT STEPS:")
-        print("   1. Update your main application to use the working endpoints")
-        print("   2. Test your NL2DAX queries against the actual tables")
-        print("   3. Set up periodic refresh if needed")
-    else:
-        print("❌ Semantic model refresh issues persist")
-        print()
-        print("🔧 MANUAL STEPS NEEDED:")
-        print("   1. Open Fabric portal (https://app.fabric.microsoft.com)")
-        print("   2. Navigate to your workspace")
-        print("   3. Find the 'adventureworksdb' semantic model")
-        print("   4. Click 'Refresh' manually")
-        print("   5. Wait for refresh to complete")
-        print("   6. Test DAX queries again")
         print()
-        print("   Or check mirrored database sync status:")
-        print("   - Find 'adventureworksdb' mirrored database")
-        print("   - Check if mirroring is active and synced")
-        print("   - Verify Azure SQL connectivity")
+        print("📊 FINAL RESULTS")
+        print("=" * 20)
+    
+        if success:
+            print("🎉 SUCCESS! Fabric mirrored database is now working!")
+            print("   ✅ Semantic model has been refreshed")
+            print("   ✅ Tables are now accessible via DAX queries")
+            print("   ✅ Your NL2DAX application should now work")
+            print()
+            print("🔧 NEXT STEPS:")
+            print("   1. Update your main application to use the working endpoints")
+            print("   2. Test your NL2DAX queries against the actual tables")
+            print("   3. Set up periodic refresh if needed")
+        else:
+            print("❌ Semantic model refresh issues persist")
+            print()
+            print("🔧 MANUAL STEPS NEEDED:")
+            print("   1. Open Fabric portal (https://app.fabric.microsoft.com)")
+            print("   2. Navigate to your workspace")
+            print("   3. Find the 'adventureworksdb' semantic model")
+            print("   4. Click 'Refresh' manually")
+            print("   5. Wait for refresh to complete")
+            print("   6. Test DAX queries again")
+            print()
+            print("   Or check mirrored database sync status:")
+            print("   - Find 'adventureworksdb' mirrored database")
+            print("   - Check if mirroring is active and synced")
+            print("   - Verify Azure SQL connectivity")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
-    return 0 if success else 1
+        return 0 if success else 1
 
 if __name__ == "__main__":
     exit(main())
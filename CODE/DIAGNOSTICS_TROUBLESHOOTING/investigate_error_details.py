@@ -5,14 +5,60 @@ Get full error messages and check dataset compatibility
 """
 
 import os
-import requests
-import msal
+import re
+import sys
 import json
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, buffered_output, cached_get, json_loads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 
+def pretty_json(data):
+    """Format parsed JSON for display with two-space indentation"""
+    if orjson is None:
+        return json.dumps(data, indent=2)
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+
+# Error body patterns checked in order; the first match gives the hint
+_ERR_PATTERNS = [
+    (re.compile(rb"table.{0,40}not found", re.I), "missing table/column reference"),
+    (re.compile(rb"permission", re.I), "permission issue"),
+    (re.compile(rb"syntax", re.I), "syntax issue"),
+]
+
+def _check_mode(default_mode):
+    """Flag dataset modes that may not support all DAX queries"""
+    if default_mode == 'DirectQuery':
+        return "Dataset is in DirectQuery mode - may not support all DAX queries"
+    if default_mode == 'Composite':
+        return "Dataset is in Composite mode - may have limitations"
+    if default_mode not in ['Import', 'Push']:
+        return f"Unknown dataset mode: {default_mode}"
+    return None
+
+def _check_gateway(required):
+    """Flag datasets that need an on-premises gateway"""
+    return "Dataset requires on-premises gateway" if required else None
+
+def _check_refresh(refreshable):
+    """Flag datasets that cannot be refreshed"""
+    return None if refreshable else "Dataset is not refreshable"
+
+# Dataset properties checked for executeQueries compatibility
+_CHECKS = {
+    "defaultMode": _check_mode,
+    "isOnPremGatewayRequired": _check_gateway,
+    "isRefreshable": _check_refresh,
+}
+
 class DatasetExecuteQueriesInvestigator:
     """Investigate DatasetExecuteQueriesError in detail"""
     
@@ -25,20 +71,24 @@ class DatasetExecuteQueriesInvestigator:
         self.token = None
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # Imported here so the banner prints before requests loads
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        # One pooled keep-alive session so repeated probes reuse the TLS connection
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        self.session.headers.update({"Content-Type": "application/json"})
+        
     def get_token(self):
         """Get Azure AD token"""
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Served from the persisted cache while the previous token is valid
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.session.headers.update({"Authorization": f"Bearer {self.token}"})
                 return True
             else:
                 print(f"❌ Token failed: {result.get('error_description', 'Unknown')}")
@@ -48,13 +98,9 @@ class DatasetExecuteQueriesInvestigator:
             print(f"❌ Token error: {e}")
             return False
     
+    @buffered_output
     def get_full_error_details(self):
         """Get full error details from executeQueries"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
         payload = {
             "queries": [{"query": "EVALUATE { 1 }"}],
@@ -65,7 +111,7 @@ class DatasetExecuteQueriesInvestigator:
         print("-" * 40)
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = self.session.post(url, json=payload, timeout=30)
             
             print(f"Status Code: {response.status_code}")
             print(f"Response Headers: {dict(response.headers)}")
@@ -77,9 +123,9 @@ class DatasetExecuteQueriesInvestigator:
                 print()
                 
                 try:
-                    error_data = response.json()
+                    error_data = json_loads(response.content)
                     print("Parsed Error Details:")
-                    print(json.dumps(error_data, indent=2))
+                    print(pretty_json(error_data))
                     print()
                     
                     # Extract detailed error information
@@ -110,48 +156,40 @@ class DatasetExecuteQueriesInvestigator:
         
         return False
     
+    @buffered_output
     def check_dataset_compatibility(self):
         """Check if dataset is compatible with executeQueries"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("📊 DATASET COMPATIBILITY CHECK")
         print("-" * 40)
         
         try:
-            # Get detailed dataset information
-            response = requests.get(
+            # Get detailed dataset information, revalidated against the cached copy
+            status_code, body = cached_get(
+                self.session,
                 f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}",
-                headers=headers,
                 timeout=30
             )
             
-            if response.status_code == 200:
-                dataset = response.json()
+            if status_code == 200:
+                dataset = json_loads(body)
                 
-                print("Dataset Properties:")
+                # Print every property and run the compatibility checks in the same pass
+                results = {}
+                lines = ["Dataset Properties:"]
                 for key, value in dataset.items():
-                    print(f"  {key}: {value}")
-                print()
+                    lines.append(f"  {key}: {value}")
+                    check = _CHECKS.get(key)
+                    if check:
+                        results[key] = check(value)
+                lines.append("")
+                sys.stdout.write("\n".join(lines) + "\n")
                 
-                # Check specific compatibility factors
+                # Properties missing from the response are checked as None
                 compatibility_issues = []
-                
-                # Check dataset mode
-                default_mode = dataset.get('defaultMode')
-                if default_mode == 'DirectQuery':
-                    compatibility_issues.append("Dataset is in DirectQuery mode - may not support all DAX queries")
-                elif default_mode == 'Composite':
-                    compatibility_issues.append("Dataset is in Composite mode - may have limitations")
-                elif default_mode not in ['Import', 'Push']:
-                    compatibility_issues.append(f"Unknown dataset mode: {default_mode}")
-                
-                # Check if on-premises
-                if dataset.get('isOnPremGatewayRequired'):
-                    compatibility_issues.append("Dataset requires on-premises gateway")
-                
-                # Check refresh status
-                if not dataset.get('isRefreshable'):
-                    compatibility_issues.append("Dataset is not refreshable")
+                for key, check in _CHECKS.items():
+                    issue = results[key] if key in results else check(None)
+                    if issue:
+                        compatibility_issues.append(issue)
                 
                 print("Compatibility Analysis:")
                 if compatibility_issues:
@@ -167,11 +205,6 @@ class DatasetExecuteQueriesInvestigator:
     
     def test_different_dax_queries(self):
         """Test different types of DAX queries to isolate the issue"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
         
         print("🧪 DIFFERENT DAX QUERY TESTS")
@@ -186,47 +219,48 @@ class DatasetExecuteQueriesInvestigator:
             ("INFO.TABLES", "EVALUATE INFO.TABLES()"),
         ]
         
+        # executeQueries accepts one query per request; one payload is reused
+        # across the calls and only the query changes
+        payload = {
+            "queries": [{"query": None}],
+            "serializerSettings": {"includeNulls": True}
+        }
+        
         for test_name, query in test_queries:
             print(f"Testing: {test_name}")
             print(f"Query: {query}")
             
-            payload = {
-                "queries": [{"query": query}],
-                "serializerSettings": {"includeNulls": True}
-            }
+            payload["queries"][0]["query"] = query
             
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self.session.post(url, json=payload, timeout=30)
                 print(f"Status: {response.status_code}")
                 
                 if response.status_code == 200:
                     print("Result: ✅ SUCCESS")
                     try:
-                        data = response.json()
+                        data = json_loads(response.content)
                         if data.get('results'):
                             tables = data['results'][0].get('tables', [])
                             if tables:
                                 rows = tables[0].get('rows', [])
                                 print(f"Rows returned: {len(rows)}")
-                    except:
+                    except (ValueError, AttributeError):
                         pass
                 else:
                     print("Result: ❌ FAILED")
                     try:
-                        error_data = response.json()
+                        error_data = json_loads(response.content)
                         error_code = error_data.get('error', {}).get('code', 'Unknown')
                         print(f"Error: {error_code}")
                         
-                        # Look for specific error patterns
-                        error_text = str(error_data).lower()
-                        if "table" in error_text and "not found" in error_text:
-                            print("  🔍 Suggests missing table/column reference")
-                        elif "permission" in error_text:
-                            print("  🔍 Suggests permission issue")
-                        elif "syntax" in error_text:
-                            print("  🔍 Suggests syntax issue")
+                        # Look for specific error patterns in the raw body
+                        for pattern, hint in _ERR_PATTERNS:
+                            if pattern.search(response.content):
+                                print(f"  🔍 Suggests {hint}")
+                                break
                         
-                    except:
+                    except (ValueError, AttributeError):
                         print(f"Raw error: {response.text[:100]}")
                 
                 print()
@@ -245,7 +279,7 @@ def main():
     """Main investigation function"""
     print("🔍 DATASET EXECUTE QUERIES ERROR INVESTIGATOR")
     print("=" * 60)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Get full error details and check dataset compatibility")
     print()
@@ -285,7 +319,7 @@ def main():
         print("4. Ensure dataset is properly refreshed and active")
         print("5. Contact Power BI administrator for tenant-level settings")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
     return 0 if (success1 or success2) else 1
 
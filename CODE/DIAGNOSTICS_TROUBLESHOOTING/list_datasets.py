@@ -5,28 +5,19 @@ Helper script to find available dataset IDs
 """
 
 import os
-import requests
-import msal
 import json
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import iter_values
+
 # Load environment variables
 load_dotenv()
 
 def get_token():
     """Get Azure AD token"""
-    tenant_id = os.getenv("PBI_TENANT_ID")
-    client_id = os.getenv("PBI_CLIENT_ID")
-    client_secret = os.getenv("PBI_CLIENT_SECRET")
-    
-    app = msal.ConfidentialClientApplication(
-        client_id=client_id,
-        client_credential=client_secret,
-        authority=f"https://login.microsoftonline.com/{tenant_id}"
-    )
-    
-    scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-    result = app.acquire_token_for_client(scopes=scopes)
+    # Served from the persisted cache while the previous token is valid
+    result = auth_cache.get_token(auth_cache.PBI_SCOPES)
     
     if "access_token" in result:
         return result["access_token"]
@@ -34,6 +25,19 @@ def get_token():
         print(f"❌ Token failed: {result}")
         return None
 
+def create_session(token):
+    """Create a pooled keep-alive session authorized with the given token"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+    session.headers.update({
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    })
+    return session
+
 def list_datasets():
     """List all datasets in the workspace"""
     token = get_token()
@@ -42,33 +46,30 @@ def list_datasets():
         
     workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    session = create_session(token)
     
     url = f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets"
     
     try:
-        response = requests.get(url, headers=headers)
+        response = session.get(url, stream=True, timeout=30)
         
         if response.status_code == 200:
-            datasets = response.json()
-            
             print("📊 AVAILABLE DATASETS IN WORKSPACE")
             print("=" * 50)
             print(f"Workspace ID: {workspace_id}")
             print()
             
-            if datasets.get("value"):
-                for i, dataset in enumerate(datasets["value"], 1):
-                    print(f"{i}. Dataset: {dataset.get('name', 'Unknown')}")
-                    print(f"   ID: {dataset.get('id')}")
-                    print(f"   Configured By: {dataset.get('configuredBy', 'Unknown')}")
-                    print(f"   Is Refreshable: {dataset.get('isRefreshable', False)}")
-                    print(f"   Web URL: {dataset.get('webUrl', 'N/A')}")
-                    print()
-                    
+            # Print each dataset as it is parsed off the wire
+            count = 0
+            for count, dataset in enumerate(iter_values(response), 1):
+                print(f"{count}. Dataset: {dataset.get('name', 'Unknown')}")
+                print(f"   ID: {dataset.get('id')}")
+                print(f"   Configured By: {dataset.get('configuredBy', 'Unknown')}")
+                print(f"   Is Refreshable: {dataset.get('isRefreshable', False)}")
+                print(f"   Web URL: {dataset.get('webUrl', 'N/A')}")
+                print()
+            
+            if count:
                 print("💡 To use a dataset, set POWERBI_DATASET_ID environment variable")
                 print("   Example: export POWERBI_DATASET_ID=<dataset_id>")
                 
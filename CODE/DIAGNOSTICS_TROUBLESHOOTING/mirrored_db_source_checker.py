@@ -4,15 +4,56 @@ Mirrored Database Source Connection Checker
 Check if the source Azure SQL database is accessible and properly configured
 """
 
+import asyncio
 import os
-import requests
-import msal
-import json
+import re
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from itertools import islice
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, ThreadRoutedStdout, buffered_output, cached_get, iter_values, json_loads, run_captured
+
 load_dotenv()
 
+# Mirrored database property names that may describe the source connection
+_SOURCE_KEY_PATTERN = re.compile("source|connection|azure", re.I)
+
+def refresh_duration(refresh):
+    """Seconds between a refresh's ISO-8601 start and end times, or None"""
+    try:
+        start_dt = datetime.fromisoformat(refresh['startTime'].replace("Z", "+00:00"))
+        end_dt = datetime.fromisoformat(refresh['endTime'].replace("Z", "+00:00"))
+    except (KeyError, AttributeError, ValueError):
+        return None
+    return (end_dt - start_dt).total_seconds()
+
+_addr_cache = {}
+
+def resolve(host, port):
+    """Resolve host:port for TCP (IPv4 and IPv6), once per run"""
+    key = (host, port)
+    if key not in _addr_cache:
+        _addr_cache[key] = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return _addr_cache[key]
+
+async def tcp_reachable(host, port, timeout=2):
+    """Connect to every resolved address of host:port at once; True if any accepts"""
+    async def connect(sockaddr):
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(sockaddr[0], sockaddr[1]), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        await writer.wait_closed()
+        return True
+    
+    results = await asyncio.gather(*(connect(info[4]) for info in resolve(host, port)))
+    return any(results)
+
 class MirroredDatabaseSourceChecker:
     """Check mirrored database source connection and configuration"""
     
@@ -28,19 +69,21 @@ class MirroredDatabaseSourceChecker:
         self.fabric_url = "https://api.fabric.microsoft.com/v1"
         self.powerbi_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # Imported here so the banner prints before requests loads
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        # One pooled keep-alive session; the Fabric and Power BI calls use
+        # different tokens, so Authorization is still passed per request
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+        
     def get_tokens(self):
         """Get authentication tokens"""
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
+            # Both tokens are served from the persisted cache while still valid
             # Power BI token
-            pbi_result = app.acquire_token_for_client(
-                scopes=["https://analysis.windows.net/powerbi/api/.default"]
-            )
+            pbi_result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in pbi_result:
                 self.powerbi_token = pbi_result["access_token"]
@@ -50,9 +93,7 @@ class MirroredDatabaseSourceChecker:
                 return False
             
             # Fabric token
-            fabric_result = app.acquire_token_for_client(
-                scopes=["https://api.fabric.microsoft.com/.default"]
-            )
+            fabric_result = auth_cache.get_token(auth_cache.FABRIC_SCOPES)
             
             if "access_token" in fabric_result:
                 self.fabric_token = fabric_result["access_token"]
@@ -75,16 +116,18 @@ class MirroredDatabaseSourceChecker:
         print("-" * 50)
         
         try:
-            response = requests.get(
+            # Revalidated against the cached copy; an unchanged config comes back as 304
+            status_code, body = cached_get(
+                self.session,
                 f"{self.fabric_url}/workspaces/{self.workspace_id}/mirroreddatabases/{self.mirrored_db_id}",
                 headers=headers,
                 timeout=30
             )
             
-            print(f"Status: {response.status_code}")
+            print(f"Status: {status_code}")
             
-            if response.status_code == 200:
-                db_config = response.json()
+            if status_code == 200:
+                db_config = json_loads(body)
                 print("✅ Mirrored Database Configuration:")
                 
                 # Extract key configuration details
@@ -108,9 +151,12 @@ class MirroredDatabaseSourceChecker:
                 print("🔗 Source Connection Analysis:")
                 
                 # Check if there are any source properties
-                for key, value in properties.items():
-                    if 'source' in key.lower() or 'connection' in key.lower() or 'azure' in key.lower():
-                        print(f"   {key}: {value}")
+                matches = [
+                    f"   {key}: {value}" for key, value in properties.items()
+                    if _SOURCE_KEY_PATTERN.search(key)
+                ]
+                if matches:
+                    print("\n".join(matches))
                 
                 # The connection string might give us clues about the source
                 connection_string = sql_endpoint.get('connectionString', '')
@@ -122,7 +168,7 @@ class MirroredDatabaseSourceChecker:
                 return db_config
                 
             else:
-                print(f"❌ Error: {response.text}")
+                print(f"❌ Error: {body.decode('utf-8', errors='replace')}")
                 return None
                 
         except Exception as e:
@@ -137,37 +183,38 @@ class MirroredDatabaseSourceChecker:
         print("-" * 40)
         
         try:
-            response = requests.get(
+            # Only the latest few refreshes are analysed, so don't fetch the rest
+            response = self.session.get(
                 f"{self.powerbi_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/refreshes",
                 headers=headers,
+                params={"$top": 5},
+                stream=True,
                 timeout=30
             )
             
             print(f"Refresh history status: {response.status_code}")
             
             if response.status_code == 200:
-                refreshes = response.json().get('value', [])
-                print(f"Found {len(refreshes)} refresh attempts")
+                refreshes = list(islice(iter_values(response), 5))
+                durations = [refresh_duration(refresh) for refresh in refreshes]
+                print(f"Found {len(refreshes)} recent refresh attempts")
                 
                 if refreshes:
                     print("\nDetailed Refresh Analysis:")
                     
-                    for i, refresh in enumerate(refreshes[:3], 1):  # Check last 3 refreshes
+                    # Check last 3 refreshes
+                    for i, (refresh, duration) in enumerate(zip(refreshes[:3], durations), 1):
                         print(f"\n🔄 Refresh {i}:")
                         print(f"   Status: {refresh.get('status', 'Unknown')}")
                         print(f"   Start: {refresh.get('startTime', 'Unknown')}")
                         print(f"   End: {refresh.get('endTime', 'Unknown')}")
                         print(f"   Request ID: {refresh.get('requestId', 'Unknown')}")
                         
-                        # Calculate duration
-                        start_time = refresh.get('startTime')
-                        end_time = refresh.get('endTime')
-                        if start_time and end_time:
-                            try:
-                                from dateutil import parser
-                                start_dt = parser.parse(start_time)
-                                end_dt = parser.parse(end_time)
-                                duration = (end_dt - start_dt).total_seconds()
+                        # Report duration
+                        if refresh.get('startTime') and refresh.get('endTime'):
+                            if duration is None:
+                                print("   Duration: Unable to calculate")
+                            else:
                                 print(f"   Duration: {duration:.1f} seconds")
                                 
                                 if duration < 5:
@@ -176,8 +223,6 @@ class MirroredDatabaseSourceChecker:
                                     print("   ⚠️  Very slow refresh - may indicate connection issues")
                                 else:
                                     print("   ✅ Normal refresh duration")
-                            except:
-                                print("   Duration: Unable to calculate")
                         
                         # Check for errors
                         if refresh.get('status') == 'Failed':
@@ -192,16 +237,16 @@ class MirroredDatabaseSourceChecker:
                             if key not in ['status', 'startTime', 'endTime', 'requestId', 'serviceExceptionJson']:
                                 print(f"   {key}: {value}")
                 
-                return refreshes
+                return refreshes, durations
             else:
                 print(f"❌ Error: {response.text}")
-                return []
+                return [], []
                 
         except Exception as e:
             print(f"❌ Exception: {e}")
-            return []
+            return [], []
     
-    def test_fabric_sql_endpoint_connectivity(self):
+    async def test_fabric_sql_endpoint_connectivity(self):
         """Test the Fabric SQL endpoint that was discovered"""
         print("🔗 FABRIC SQL ENDPOINT CONNECTIVITY TEST")
         print("-" * 50)
@@ -215,8 +260,6 @@ class MirroredDatabaseSourceChecker:
         # Try to test connectivity (this might require SQL authentication)
         print("Testing SQL endpoint accessibility:")
         
-        import socket
-        
         try:
             # Test if the endpoint is reachable
             host = sql_endpoint
@@ -224,12 +267,9 @@ class MirroredDatabaseSourceChecker:
             
             print(f"   Testing TCP connection to {host}:{port}")
             
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            result = sock.connect_ex((host, port))
-            sock.close()
-            
-            if result == 0:
+            # Non-blocking connects to every A and AAAA address in parallel,
+            # so the wait is the slowest single attempt rather than their sum
+            if await tcp_reachable(host, port):
                 print("   ✅ TCP connection successful")
                 print("   The Fabric SQL endpoint is reachable")
             else:
@@ -246,7 +286,8 @@ class MirroredDatabaseSourceChecker:
         print("   • The source Azure SQL connection is configured in Fabric portal")
         print("   • If the source is unreachable, refreshes succeed but create no tables")
     
-    def analyze_mirrored_database_issue(self, db_config, refresh_history):
+    @buffered_output
+    def analyze_mirrored_database_issue(self, db_config, refresh_history, durations):
         """Analyze all gathered information to determine the root cause"""
         print("🔬 ROOT CAUSE ANALYSIS")
         print("-" * 25)
@@ -261,20 +302,8 @@ class MirroredDatabaseSourceChecker:
         
         # Check refresh pattern
         if refresh_history:
-            fast_refreshes = 0
-            for refresh in refresh_history[:5]:
-                start_time = refresh.get('startTime')
-                end_time = refresh.get('endTime')
-                if start_time and end_time:
-                    try:
-                        from dateutil import parser
-                        start_dt = parser.parse(start_time)
-                        end_dt = parser.parse(end_time)
-                        duration = (end_dt - start_dt).total_seconds()
-                        if duration < 5:
-                            fast_refreshes += 1
-                    except:
-                        pass
+            # Durations were already parsed by check_dataset_refresh_logs_detailed
+            fast_refreshes = sum(duration < 5 for duration in durations[:5] if duration is not None)
             
             if fast_refreshes >= 2:
                 print("🚨 PATTERN DETECTED: Very fast refreshes")
@@ -317,7 +346,7 @@ def main():
     """Main source connection checker"""
     print("🔗 MIRRORED DATABASE SOURCE CONNECTION CHECKER")
     print("=" * 55)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Check source Azure SQL database connection")
     print("🎯 Goal: Determine why mirrored database has no tables")
@@ -331,22 +360,31 @@ def main():
     
     print()
     
-    # Get full mirrored database configuration
-    db_config = checker.get_mirrored_database_full_details()
-    print()
-    
-    # Get detailed refresh logs
-    refresh_history = checker.check_dataset_refresh_logs_detailed()
-    print()
+    # The three probes hit independent endpoints, so run them concurrently and
+    # print each one's buffered output as soon as it finishes
+    original_stdout = sys.stdout
+    sys.stdout = ThreadRoutedStdout(original_stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            config_future = executor.submit(run_captured, checker.get_mirrored_database_full_details)
+            refresh_future = executor.submit(run_captured, checker.check_dataset_refresh_logs_detailed)
+            sql_future = executor.submit(
+                run_captured, lambda: asyncio.run(checker.test_fabric_sql_endpoint_connectivity())
+            )
+            
+            for future in as_completed([config_future, refresh_future, sql_future]):
+                _, output = future.result()
+                print(output)
+    finally:
+        sys.stdout = original_stdout
     
-    # Test Fabric SQL endpoint connectivity
-    checker.test_fabric_sql_endpoint_connectivity()
-    print()
+    db_config = config_future.result()[0]
+    refresh_history, durations = refresh_future.result()[0]
     
     # Analyze all findings
-    checker.analyze_mirrored_database_issue(db_config, refresh_history)
+    checker.analyze_mirrored_database_issue(db_config, refresh_history, durations)
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
     return 0
 
@@ -5,14 +5,58 @@ Use admin APIs to get detailed dataset information that regular APIs don't provi
 """
 
 import os
+import sys
+import threading
 import requests
-import msal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, buffered_output, cached_get, json_loads
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 
+# Process-wide cap on in-flight admin requests, so running the inspector
+# against several workspaces at once doesn't trip tenant throttling
+MAX_CONCURRENT_REQUESTS = 8
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+def json_preview(value, limit):
+    """Compact JSON for a nested value, cut to limit characters"""
+    if orjson is None:
+        return json.dumps(value, separators=(",", ":"))[:limit]
+    return orjson.dumps(value)[:limit].decode("utf-8", errors="ignore")
+
+# $expand variants requested for the target dataset
+EXPAND_OPTIONS = [
+    ("encryption", "encryption"),
+    ("users", "users"),
+    ("queryScaleOutSettings", "queryScaleOutSettings"),
+    ("upstreamDataflows", "upstreamDataflows"),
+    ("all", "encryption,users,queryScaleOutSettings,upstreamDataflows")
+]
+ALL_EXPAND = EXPAND_OPTIONS[-1][1]
+
+# Admin-only dataset properties shown for each dataset in the workspace
+ADMIN_PROPERTIES = (
+    'configuredBy', 'isRefreshable', 'isOnPremGatewayRequired',
+    'isEffectiveIdentityRequired', 'isEffectiveIdentityRolesRequired',
+    'addRowsAPIEnabled', 'isInPlaceSharingEnabled', 'targetStorageMode',
+    'contentProviderType', 'createdDate', 'description'
+)
+
+# Properties that only show up on mirrored database items
+MIRROR_KEYS = ('oneLakeTablesPath', 'sqlEndpointProperties', 'mirroredDatabase')
+
 class PowerBIAdminInspector:
     """Use Power BI Admin APIs to inspect dataset details"""
     
@@ -23,24 +67,29 @@ class PowerBIAdminInspector:
         self.workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
         self.dataset_id = os.getenv("POWERBI_DATASET_ID", "fc4d80c8-090e-4441-8336-217490bde820")
         self.token = None
+        self.admin_denied = None
         self.admin_url = "https://api.powerbi.com/v1.0/myorg/admin"
         
+        # One keep-alive session for every admin call, retrying throttling and
+        # transient server errors
+        self.session = requests.Session()
+        retries = Retry(
+            total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retries))
+        
     def get_token_with_admin_scope(self):
         """Get token with admin scope (Tenant.Read.All)"""
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
             # For service principal, use the standard Power BI scope
-            # Admin permissions are granted through Azure AD app permissions
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Admin permissions are granted through Azure AD app permissions.
+            # Served from the persisted cache while the previous token is valid
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.session.headers["Authorization"] = f"Bearer {self.token}"
                 print("✅ Token acquired with admin scope")
                 return True
             else:
@@ -51,25 +100,51 @@ class PowerBIAdminInspector:
             print(f"❌ Admin token error: {e}")
             return False
     
-    def get_datasets_in_workspace_admin(self):
+    def throttled_get(self, url, **kwargs):
+        """GET url on the shared session, holding one of the process-wide request slots"""
+        with _request_slots:
+            return self.session.get(url, **kwargs)
+    
+    def admin_get(self, url, params=None):
+        """ETag-cached admin GET holding one of the process-wide request slots; returns (status_code, body)"""
+        with _request_slots:
+            return cached_get(self.session, url, params=params, timeout=30)
+    
+    def get_concurrently(self, *calls):
+        """Start independent GETs in parallel from (url, params) pairs; returns futures in order"""
+        executor = ThreadPoolExecutor(max_workers=len(calls))
+        futures = [executor.submit(self.admin_get, url, params) for url, params in calls]
+        executor.shutdown(wait=False)
+        return futures
+    
+    def start_admin_lookups(self):
+        """Start every admin GET the inspection needs without waiting for them"""
+        # None of the calls depend on each other, so issue them together and
+        # let each section print its results in order
+        datasets, workspace, dataflows = self.get_concurrently(
+            (f"{self.admin_url}/groups/{self.workspace_id}/datasets", None),
+            (f"{self.admin_url}/groups/{self.workspace_id}", None),
+            (f"{self.admin_url}/groups/{self.workspace_id}/dataflows", None)
+        )
+        return {"datasets": datasets, "workspace": workspace, "dataflows": dataflows}
+    
+    @buffered_output
+    def get_datasets_in_workspace_admin(self, lookup=None):
         """Get all datasets in workspace using admin API"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("🔍 ADMIN API: DATASETS IN WORKSPACE")
         print("-" * 45)
         
         # Basic admin call
         try:
-            response = requests.get(
-                f"{self.admin_url}/groups/{self.workspace_id}/datasets",
-                headers=headers,
-                timeout=30
-            )
+            if lookup:
+                status_code, body = lookup.result()
+            else:
+                status_code, body = self.admin_get(f"{self.admin_url}/groups/{self.workspace_id}/datasets")
             
-            print(f"Admin datasets status: {response.status_code}")
+            print(f"Admin datasets status: {status_code}")
             
-            if response.status_code == 200:
-                datasets_data = response.json()
+            if status_code == 200:
+                datasets_data = json_loads(body)
                 datasets = datasets_data.get('value', [])
                 
                 print(f"✅ Found {len(datasets)} datasets in workspace")
@@ -80,172 +155,185 @@ class PowerBIAdminInspector:
                     dataset_name = dataset.get('name', 'Unknown')
                     is_target = "🎯" if dataset_id == self.dataset_id else "📊"
                     
-                    print(f"{is_target} Dataset {i}: {dataset_name}")
-                    print(f"   ID: {dataset_id}")
+                    lines = [f"{is_target} Dataset {i}: {dataset_name}", f"   ID: {dataset_id}"]
                     
                     # Show key admin properties
-                    admin_properties = [
-                        'configuredBy', 'isRefreshable', 'isOnPremGatewayRequired',
-                        'isEffectiveIdentityRequired', 'isEffectiveIdentityRolesRequired',
-                        'addRowsAPIEnabled', 'isInPlaceSharingEnabled', 'targetStorageMode',
-                        'contentProviderType', 'createdDate', 'description'
-                    ]
-                    
-                    for prop in admin_properties:
-                        if prop in dataset:
-                            value = dataset[prop]
-                            print(f"   {prop}: {value}")
+                    lines.extend(f"   {prop}: {dataset[prop]}" for prop in ADMIN_PROPERTIES if prop in dataset)
                     
                     # Check for dataflows and dependencies
                     if 'upstreamDataflows' in dataset:
                         dataflows = dataset['upstreamDataflows']
                         if dataflows:
-                            print(f"   upstreamDataflows: {len(dataflows)} dependencies")
-                            for df in dataflows:
-                                print(f"      → {df.get('targetDataflowId', 'Unknown')}")
+                            lines.append(f"   upstreamDataflows: {len(dataflows)} dependencies")
+                            lines.extend(f"      → {df.get('targetDataflowId', 'Unknown')}" for df in dataflows)
                         else:
-                            print(f"   upstreamDataflows: None")
+                            lines.append("   upstreamDataflows: None")
                     
-                    print()
+                    # One write per dataset
+                    sys.stdout.write("\n".join(lines) + "\n\n")
                 
                 return datasets
                 
-            elif response.status_code == 403:
+            elif status_code == 403:
+                self.admin_denied = 403
                 print("❌ 403 Forbidden - Service principal may not have admin permissions")
                 print("   Check Azure AD app registration for Tenant.Read.All permission")
                 print("   And ensure admin consent has been granted")
-            elif response.status_code == 401:
+            elif status_code == 401:
+                self.admin_denied = 401
                 print("❌ 401 Unauthorized - Token may not have admin scope")
             else:
-                print(f"❌ Error {response.status_code}: {response.text}")
+                print(f"❌ Error {status_code}: {body.decode('utf-8', errors='replace')}")
                 
         except Exception as e:
             print(f"❌ Exception: {e}")
         
         return []
     
+    def fetch_expanded_dataset(self, expand_value):
+        """GET the target dataset with $expand; returns (response, dataset or None)"""
+        response = self.throttled_get(
+            f"{self.admin_url}/groups/{self.workspace_id}/datasets",
+            params={"$expand": expand_value, "$filter": f"id eq '{self.dataset_id}'"},
+            timeout=30
+        )
+        
+        dataset = None
+        if response.status_code == 200:
+            datasets = json_loads(response.content).get('value', [])
+            if datasets:
+                dataset = datasets[0]
+        return response, dataset
+    
+    def print_expanded_dataset(self, expand_name, dataset):
+        """Print the properties one $expand variant adds to the dataset"""
+        print(f"   ✅ Dataset found with {expand_name} details")
+        
+        # Show expanded properties
+        if expand_name == "encryption" and 'encryption' in dataset:
+            encryption = dataset['encryption']
+            print(f"      Encryption Status: {encryption.get('encryptionStatus', 'Unknown')}")
+        
+        elif expand_name == "users" and 'users' in dataset:
+            users = dataset['users']
+            print(f"      Users: {len(users)} user entries")
+            for user in users[:3]:  # Show first 3
+                display_name = user.get('displayName', 'Unknown')
+                access_right = user.get('datasetUserAccessRight', 'Unknown')
+                principal_type = user.get('principalType', 'Unknown')
+                print(f"         → {display_name} ({principal_type}): {access_right}")
+        
+        elif expand_name == "queryScaleOutSettings" and 'queryScaleOutSettings' in dataset:
+            scale_out = dataset['queryScaleOutSettings']
+            print(f"      Auto Sync: {scale_out.get('autoSyncReadOnlyReplicas', 'Unknown')}")
+            print(f"      Max Replicas: {scale_out.get('maxReadOnlyReplicas', 'Unknown')}")
+        
+        elif expand_name == "upstreamDataflows" and 'upstreamDataflows' in dataset:
+            dataflows = dataset['upstreamDataflows']
+            print(f"      Upstream Dataflows: {len(dataflows)}")
+            for df in dataflows:
+                group_id = df.get('groupId', 'Unknown')
+                df_id = df.get('targetDataflowId', 'Unknown')
+                print(f"         → {df_id} (in {group_id})")
+        
+        elif expand_name == "all":
+            print("      Full dataset with all expansions:")
+            # Show any additional properties not shown in basic call
+            basic_props = {'id', 'name', 'configuredBy', 'isRefreshable', 'targetStorageMode'}
+            for key, value in dataset.items():
+                if key not in basic_props:
+                    if isinstance(value, (dict, list)):
+                        print(f"         {key}: {json_preview(value, 150)}...")
+                    else:
+                        print(f"         {key}: {value}")
+    
+    @buffered_output
     def get_dataset_details_with_expand(self):
         """Get dataset details with expanded properties"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("🔍 ADMIN API: DATASET DETAILS WITH EXPAND")
         print("-" * 50)
         
-        # Try different expand options
-        expand_options = [
-            ("encryption", "encryption"),
-            ("users", "users"),
-            ("queryScaleOutSettings", "queryScaleOutSettings"),
-            ("upstreamDataflows", "upstreamDataflows"),
-            ("all", "encryption,users,queryScaleOutSettings,upstreamDataflows")
-        ]
+        # One filtered request with every expansion serves all five views;
+        # only if that fails is each expansion requested on its own
+        combined, combined_status, combined_ok = None, None, False
+        try:
+            combined_response, combined = self.fetch_expanded_dataset(ALL_EXPAND)
+            combined_status = combined_response.status_code
+            combined_ok = combined_status == 200
+            if combined_status == 400:
+                # Some tenants reject the combined $expand but accept each part
+                print("Combined expand request returned 400 - requesting each expansion separately")
+                print()
+            elif not combined_ok:
+                # Any other failure would just repeat for each expansion
+                print(f"❌ Error {combined_status}: {combined_response.text[:100]}")
+                print()
+                return
+        except Exception as e:
+            print(f"Combined expand request failed: {e} - requesting each expansion separately")
+            print()
         
-        for expand_name, expand_value in expand_options:
+        # Try different expand options
+        for expand_name, expand_value in EXPAND_OPTIONS:
             print(f"Getting dataset with expand={expand_name}:")
             
             try:
-                response = requests.get(
-                    f"{self.admin_url}/groups/{self.workspace_id}/datasets",
-                    headers=headers,
-                    params={"$expand": expand_value, "$filter": f"id eq '{self.dataset_id}'"},
-                    timeout=30
-                )
+                if combined_ok:
+                    status_code, dataset = combined_status, combined
+                else:
+                    response, dataset = self.fetch_expanded_dataset(expand_value)
+                    status_code = response.status_code
                 
-                print(f"   Status: {response.status_code}")
+                print(f"   Status: {status_code}")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    datasets = data.get('value', [])
-                    
-                    if datasets:
-                        dataset = datasets[0]
-                        print(f"   ✅ Dataset found with {expand_name} details")
-                        
-                        # Show expanded properties
-                        if expand_name == "encryption" and 'encryption' in dataset:
-                            encryption = dataset['encryption']
-                            print(f"      Encryption Status: {encryption.get('encryptionStatus', 'Unknown')}")
-                        
-                        elif expand_name == "users" and 'users' in dataset:
-                            users = dataset['users']
-                            print(f"      Users: {len(users)} user entries")
-                            for user in users[:3]:  # Show first 3
-                                display_name = user.get('displayName', 'Unknown')
-                                access_right = user.get('datasetUserAccessRight', 'Unknown')
-                                principal_type = user.get('principalType', 'Unknown')
-                                print(f"         → {display_name} ({principal_type}): {access_right}")
-                        
-                        elif expand_name == "queryScaleOutSettings" and 'queryScaleOutSettings' in dataset:
-                            scale_out = dataset['queryScaleOutSettings']
-                            print(f"      Auto Sync: {scale_out.get('autoSyncReadOnlyReplicas', 'Unknown')}")
-                            print(f"      Max Replicas: {scale_out.get('maxReadOnlyReplicas', 'Unknown')}")
-                        
-                        elif expand_name == "upstreamDataflows" and 'upstreamDataflows' in dataset:
-                            dataflows = dataset['upstreamDataflows']
-                            print(f"      Upstream Dataflows: {len(dataflows)}")
-                            for df in dataflows:
-                                group_id = df.get('groupId', 'Unknown')
-                                df_id = df.get('targetDataflowId', 'Unknown')
-                                print(f"         → {df_id} (in {group_id})")
-                        
-                        elif expand_name == "all":
-                            print("      Full dataset with all expansions:")
-                            # Show any additional properties not shown in basic call
-                            basic_props = {'id', 'name', 'configuredBy', 'isRefreshable', 'targetStorageMode'}
-                            for key, value in dataset.items():
-                                if key not in basic_props:
-                                    if isinstance(value, (dict, list)):
-                                        print(f"         {key}: {json.dumps(value, indent=12)[:150]}...")
-                                    else:
-                                        print(f"         {key}: {value}")
+                if status_code == 200:
+                    if dataset:
+                        self.print_expanded_dataset(expand_name, dataset)
                     else:
                         print(f"   ❌ Target dataset not found with {expand_name}")
                         
                 else:
-                    print(f"   ❌ Error {response.status_code}: {response.text[:100]}")
+                    print(f"   ❌ Error {status_code}: {response.text[:100]}")
                     
             except Exception as e:
                 print(f"   ❌ Exception: {e}")
             
             print()
     
-    def check_workspace_admin_info(self):
+    @buffered_output
+    def check_workspace_admin_info(self, lookup=None):
         """Get workspace information using admin API"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("🏢 ADMIN API: WORKSPACE INFORMATION")
         print("-" * 42)
         
         try:
-            response = requests.get(
-                f"{self.admin_url}/groups/{self.workspace_id}",
-                headers=headers,
-                timeout=30
-            )
+            if lookup:
+                status_code, body = lookup.result()
+            else:
+                status_code, body = self.admin_get(f"{self.admin_url}/groups/{self.workspace_id}")
             
-            print(f"Workspace admin info status: {response.status_code}")
+            print(f"Workspace admin info status: {status_code}")
             
-            if response.status_code == 200:
-                workspace = response.json()
+            if status_code == 200:
+                workspace = json_loads(body)
                 print("✅ Workspace Admin Details:")
                 
                 # Show all workspace properties
                 for key, value in workspace.items():
                     if isinstance(value, (dict, list)):
-                        print(f"   {key}: {json.dumps(value, indent=6)[:100]}...")
+                        print(f"   {key}: {json_preview(value, 100)}...")
                     else:
                         print(f"   {key}: {value}")
                         
             else:
-                print(f"❌ Error {response.status_code}: {response.text}")
+                print(f"❌ Error {status_code}: {body.decode('utf-8', errors='replace')}")
                 
         except Exception as e:
             print(f"❌ Exception: {e}")
     
-    def check_mirrored_database_through_admin(self):
+    @buffered_output
+    def check_mirrored_database_through_admin(self, lookups=None):
         """Try to find mirrored database info through admin APIs"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         print("🔍 ADMIN API: MIRRORED DATABASE DETECTION")
         print("-" * 50)
         
@@ -255,6 +343,9 @@ class PowerBIAdminInspector:
             ("All Items", f"/groups/{self.workspace_id}/datasets"),  # Already called but check for other info
             ("Dataflows", f"/groups/{self.workspace_id}/dataflows"),
         ]
+        prefetched = {}
+        if lookups:
+            prefetched = {"Workspace Info": lookups["workspace"], "Dataflows": lookups["dataflows"]}
         
         for name, endpoint in admin_endpoints:
             if name == "All Items":
@@ -263,16 +354,15 @@ class PowerBIAdminInspector:
             print(f"Checking {name}:")
             
             try:
-                response = requests.get(
-                    f"{self.admin_url}{endpoint}",
-                    headers=headers,
-                    timeout=30
-                )
+                if name in prefetched:
+                    status_code, body = prefetched[name].result()
+                else:
+                    status_code, body = self.admin_get(f"{self.admin_url}{endpoint}")
                 
-                print(f"   Status: {response.status_code}")
+                print(f"   Status: {status_code}")
                 
-                if response.status_code == 200:
-                    data = response.json()
+                if status_code == 200:
+                    data = json_loads(body)
                     
                     if 'value' in data:  # List response
                         items = data['value']
@@ -283,28 +373,28 @@ class PowerBIAdminInspector:
                             item_type = item.get('type', item.get('objectType', 'Unknown'))
                             item_name = item.get('name', item.get('displayName', 'Unknown'))
                             
-                            if 'mirror' in item_name.lower() or 'mirror' in str(item).lower():
+                            # Scan the top-level string values rather than the repr of the whole item
+                            if any('mirror' in value.lower() for value in item.values() if isinstance(value, str)):
                                 print(f"      🔍 Potential mirrored item: {item_name} (type: {item_type})")
                             
                             # Check for specific properties that might indicate mirrored database
-                            if any(key in item for key in ['oneLakeTablesPath', 'sqlEndpointProperties', 'mirroredDatabase']):
+                            indicators = [key for key in MIRROR_KEYS if key in item]
+                            if indicators:
                                 print(f"      🎯 Mirrored DB indicator found in: {item_name}")
-                                for key in ['oneLakeTablesPath', 'sqlEndpointProperties', 'mirroredDatabase']:
-                                    if key in item:
-                                        print(f"         {key}: {item[key]}")
+                                for key in indicators:
+                                    print(f"         {key}: {item[key]}")
                     
                     else:  # Single object response
                         print(f"   ✅ Single object response")
                         # Check for mirrored database indicators
-                        mirrored_indicators = ['oneLakeTablesPath', 'sqlEndpointProperties', 'mirroredDatabase']
-                        for indicator in mirrored_indicators:
+                        for indicator in MIRROR_KEYS:
                             if indicator in data:
                                 print(f"      {indicator}: {data[indicator]}")
                 
-                elif response.status_code == 404:
+                elif status_code == 404:
                     print(f"   ❌ {name} not available via admin API")
                 else:
-                    print(f"   ⚠️  Error {response.status_code}: {response.text[:100]}")
+                    print(f"   ⚠️  Error {status_code}: {body[:100].decode('utf-8', errors='replace')}")
                     
             except Exception as e:
                 print(f"   ❌ Exception: {e}")
@@ -315,7 +405,7 @@ def main():
     """Main admin API inspection function"""
     print("🔧 POWER BI ADMIN API DATASET INSPECTOR")
     print("=" * 45)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Use admin APIs to get detailed dataset information")
     print("🎯 Goal: Find clues about why mirrored database has no tables")
@@ -329,19 +419,28 @@ def main():
     
     print()
     
+    # Fire all admin GETs at once; the sections below print as results arrive
+    lookups = inspector.start_admin_lookups()
+    
     # Get all datasets in workspace using admin API
-    datasets = inspector.get_datasets_in_workspace_admin()
+    datasets = inspector.get_datasets_in_workspace_admin(lookups["datasets"])
     print()
     
+    # Every other check uses the same admin permissions, so stop here
+    # rather than report the same 401/403 three more times
+    if inspector.admin_denied:
+        print(f"❌ Admin API access denied ({inspector.admin_denied}) - skipping the remaining admin checks")
+        return 2
+    
     # Get detailed dataset information with expand options
     inspector.get_dataset_details_with_expand()
     
     # Check workspace admin info
-    inspector.check_workspace_admin_info()
+    inspector.check_workspace_admin_info(lookups["workspace"])
     print()
     
     # Try to detect mirrored database through admin APIs
-    inspector.check_mirrored_database_through_admin()
+    inspector.check_mirrored_database_through_admin(lookups)
     
     print("🔍 ADMIN API INSIGHTS")
     print("=" * 25)
@@ -359,7 +458,7 @@ def main():
     print("   • contentProviderType: May indicate mirrored source")
     print("   • isRefreshable: Refresh capability status")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
     return 0
 
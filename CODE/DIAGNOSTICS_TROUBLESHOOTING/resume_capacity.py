@@ -5,29 +5,62 @@ Programmatically resume paused/suspended Power BI/Fabric capacities
 Requires Power BI Administrator or Capacity Administrator privileges
 """
 
-import os
+import sys
+import threading
 import requests
-import msal
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from datetime import datetime
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, ThreadRoutedStdout, json_loads, run_captured
+
 # Load environment variables
 load_dotenv()
 
+# One keep-alive pool for every call, so the resume poll loop doesn't
+# re-handshake TLS each iteration; retries are left to the callers
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=0)))
+SESSION.headers.update({"Content-Type": "application/json"})
+
+# Status poll backoff: 1s, 2s, 4s ... capped at 15s, plus up to 1s of jitter
+POLL_BASE_DELAY = 1.0
+POLL_MAX_DELAY = 15.0
+POLL_JITTER = 1.0
+
+# Capacity states (lowercased) and accepted answers to the y/N prompts
+PAUSED_STATES = frozenset({'paused', 'suspended'})
+RUNNING_STATES = frozenset({'active', 'running'})
+FAILED_STATES = frozenset({'failed', 'deleted'})
+YES_ANSWERS = frozenset({'y', 'yes'})
+
+# How long a fetched capacities list is reused before hitting the API again
+CAPACITY_CACHE_TTL = 60
+
+_capacities_cache = {"fetched_at": 0.0, "value": None}
+
+# Upper bound on capacities resumed and polled at the same time
+MAX_PARALLEL_RESUMES = 8
+
+def warm_connection(url):
+    """Open a pooled TLS connection to url's host ahead of the first real call"""
+    try:
+        SESSION.head(url, timeout=5)
+    except requests.RequestException:
+        # Only a head start; the real call will connect on its own
+        pass
+
 def get_admin_token():
     """Get Azure AD token with admin scopes for Power BI service"""
     try:
-        app = msal.ConfidentialClientApplication(
-            client_id=os.getenv("PBI_CLIENT_ID"),
-            client_credential=os.getenv("PBI_CLIENT_SECRET"),
-            authority=f"https://login.microsoftonline.com/{os.getenv('PBI_TENANT_ID')}"
-        )
-        
-        # Use Power BI admin scopes
-        scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-        result = app.acquire_token_for_client(scopes=scopes)
+        # One MSAL app per process; repeat calls (e.g. the resume poll loop)
+        # are served from its token cache instead of round-tripping Azure AD
+        result = auth_cache.get_token(auth_cache.PBI_SCOPES)
         
         if "access_token" in result:
             return result["access_token"]
@@ -38,27 +71,30 @@ def get_admin_token():
         print(f"❌ Admin token acquisition error: {e}")
         return None
 
-def get_all_capacities():
+def get_all_capacities(token=None):
     """Get all accessible capacities and their status"""
     print("🔍 SCANNING ALL CAPACITIES...")
     print("=" * 40)
     
-    token = get_admin_token()
+    cached = _capacities_cache["value"]
+    if cached is not None and time.monotonic() - _capacities_cache["fetched_at"] < CAPACITY_CACHE_TTL:
+        print(f"✅ Reusing {len(cached)} capacities fetched in the last {CAPACITY_CACHE_TTL}s")
+        return cached
+    
+    token = token or get_admin_token()
     if not token:
         return []
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {token}"}
     
     # Get all capacities via admin API
     url = "https://api.powerbi.com/v1.0/myorg/admin/capacities"
-    response = requests.get(url, headers=headers, timeout=30)
+    response = SESSION.get(url, headers=headers, timeout=30)
     
     if response.status_code == 200:
-        capacities = response.json().get('value', [])
+        capacities = json_loads(response.content).get('value', [])
         print(f"✅ Found {len(capacities)} total capacities")
+        _capacities_cache.update(fetched_at=time.monotonic(), value=capacities)
         return capacities
     elif response.status_code == 403:
         print("❌ Admin API access denied - you need Power BI Administrator privileges")
@@ -70,16 +106,13 @@ def get_all_capacities():
 
 def get_user_accessible_capacities(token):
     """Fallback to get user-accessible capacities"""
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {token}"}
     
     url = "https://api.powerbi.com/v1.0/myorg/capacities"
-    response = requests.get(url, headers=headers, timeout=30)
+    response = SESSION.get(url, headers=headers, timeout=30)
     
     if response.status_code == 200:
-        capacities = response.json().get('value', [])
+        capacities = json_loads(response.content).get('value', [])
         print(f"✅ Found {len(capacities)} accessible capacities (limited view)")
         return capacities
     else:
@@ -100,7 +133,8 @@ def identify_paused_capacities(capacities):
         state = capacity.get('state', 'Unknown')
         sku = capacity.get('sku', 'Unknown')
         
-        is_target = capacity_id == target_capacity_id
+        # The API may return GUIDs in either case
+        is_target = (capacity_id or "").lower() == target_capacity_id.lower()
         target_marker = " ← YOUR WORKSPACE CAPACITY" if is_target else ""
         
         print(f"📋 {name}{target_marker}")
@@ -108,10 +142,11 @@ def identify_paused_capacities(capacities):
         print(f"   SKU: {sku}")
         print(f"   State: {state}")
         
-        if state.lower() in ['paused', 'suspended']:
+        state_key = state.lower()
+        if state_key in PAUSED_STATES:
             print(f"   🔴 STATUS: PAUSED/SUSPENDED")
             paused_capacities.append(capacity)
-        elif state.lower() in ['active', 'running']:
+        elif state_key in RUNNING_STATES:
             print(f"   🟢 STATUS: RUNNING")
         else:
             print(f"   🟡 STATUS: UNKNOWN ({state})")
@@ -120,23 +155,20 @@ def identify_paused_capacities(capacities):
     
     return paused_capacities, target_capacity_id
 
-def resume_capacity_powerbi(capacity_id, capacity_name):
+def resume_capacity_powerbi(capacity_id, capacity_name, *, token=None):
     """Resume a Power BI Premium capacity"""
     print(f"🔄 RESUMING POWER BI CAPACITY: {capacity_name}")
     print("-" * 50)
     
-    token = get_admin_token()
+    token = token or get_admin_token()
     if not token:
         return False
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {token}"}
     
     # Try to resume via admin API
     url = f"https://api.powerbi.com/v1.0/myorg/admin/capacities/{capacity_id}/resume"
-    response = requests.post(url, headers=headers, timeout=60)
+    response = SESSION.post(url, headers=headers, timeout=60)
     
     if response.status_code == 200:
         print(f"✅ Resume command sent successfully")
@@ -154,19 +186,16 @@ def resume_capacity_powerbi(capacity_id, capacity_name):
         print(f"❌ Resume failed: {response.status_code} - {response.text}")
         return False
 
-def resume_capacity_fabric(capacity_id, capacity_name, subscription_id, resource_group):
+def resume_capacity_fabric(capacity_id, capacity_name, subscription_id, resource_group, *, token=None):
     """Resume a Fabric capacity via Azure Resource Manager"""
     print(f"🔄 RESUMING FABRIC CAPACITY: {capacity_name}")
     print("-" * 50)
     
-    token = get_admin_token()
+    token = token or get_admin_token()
     if not token:
         return False
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {token}"}
     
     # Azure Resource Manager API for Fabric capacities
     url = f"https://management.azure.com/subscriptions/{subscription_id}/resourceGroups/{resource_group}/providers/Microsoft.Fabric/capacities/{capacity_name}/resume"
@@ -174,7 +203,7 @@ def resume_capacity_fabric(capacity_id, capacity_name, subscription_id, resource
     # Add API version
     params = {"api-version": "2023-11-01"}
     
-    response = requests.post(url, headers=headers, params=params, timeout=60)
+    response = SESSION.post(url, headers=headers, params=params, timeout=60)
     
     if response.status_code == 200:
         print(f"✅ Fabric capacity resume successful")
@@ -186,44 +215,67 @@ def resume_capacity_fabric(capacity_id, capacity_name, subscription_id, resource
         print(f"❌ Fabric resume failed: {response.status_code} - {response.text}")
         return False
 
-def wait_for_capacity_resume(capacity_id, max_wait_minutes=5):
+def wait_for_capacity_resume(capacity_id, max_wait_minutes=5, *, token=None):
     """Wait for capacity to fully resume and become available"""
     print(f"\n⏳ WAITING FOR CAPACITY TO RESUME...")
     print("-" * 40)
     
-    token = get_admin_token()
+    token = token or get_admin_token()
     if not token:
         return False
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"https://api.powerbi.com/v1.0/myorg/admin/capacities/{capacity_id}"
     
-    start_time = time.time()
+    start_time = time.monotonic()
     max_wait_seconds = max_wait_minutes * 60
+    poll = 0
     
-    while time.time() - start_time < max_wait_seconds:
+    while time.monotonic() - start_time < max_wait_seconds:
         # Check capacity status
-        url = f"https://api.powerbi.com/v1.0/myorg/admin/capacities/{capacity_id}"
-        response = requests.get(url, headers=headers, timeout=30)
+        response = SESSION.get(url, headers=headers, timeout=30)
         
         if response.status_code == 200:
-            capacity = response.json()
+            capacity = json_loads(response.content)
             state = capacity.get('state', 'Unknown')
             
-            if state.lower() in ['active', 'running']:
-                elapsed = int(time.time() - start_time)
+            state_key = state.lower()
+            if state_key in RUNNING_STATES:
+                elapsed = int(time.monotonic() - start_time)
                 print(f"✅ Capacity is now RUNNING (took {elapsed} seconds)")
                 return True
+            elif state_key in FAILED_STATES:
+                print(f"❌ Capacity will not resume - state: {state}")
+                return False
             else:
                 print(f"🔄 Still resuming... Current state: {state}")
         
-        time.sleep(10)  # Wait 10 seconds before next check
+        # Poll quickly at first so fast resumes are spotted early, then back off
+        delay = min(POLL_MAX_DELAY, POLL_BASE_DELAY * 2 ** poll) + random.uniform(0, POLL_JITTER)
+        poll += 1
+        time.sleep(delay)
     
     print(f"⏰ Timeout after {max_wait_minutes} minutes - capacity may still be resuming")
     return False
 
+def resume_and_wait(capacity_id, capacity_name, *, token=None):
+    """Resume one Power BI capacity and wait for it; True if the resume was accepted"""
+    success = resume_capacity_powerbi(capacity_id, capacity_name, token=token)
+    
+    if success:
+        # Wait for it to become available
+        print(f"\n⏳ Waiting for {capacity_name} to fully resume...")
+        capacity_ready = wait_for_capacity_resume(capacity_id, max_wait_minutes=3, token=token)
+        
+        if capacity_ready:
+            print(f"✅ {capacity_name} successfully resumed and ready")
+        else:
+            print(f"⏰ {capacity_name} resume in progress (may take a few more minutes)")
+    else:
+        print(f"❌ Failed to resume {capacity_name}")
+    
+    return success
+
 def verify_dax_execution_after_resume():
     """Test DAX execution after capacity resume"""
     print(f"\n🧪 TESTING DAX EXECUTION AFTER RESUME...")
@@ -257,14 +309,24 @@ def main():
     """Main capacity resume flow"""
     print("🚀 FABRIC CAPACITY RESUME UTILITY")
     print("=" * 50)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("⚠️  WARNING: This requires Power BI Administrator privileges")
     print("   Resuming capacities may incur costs!")
     print()
     
+    # Handshake with the API while the token is being acquired, so the
+    # first admin call finds a ready connection in the pool
+    threading.Thread(target=warm_connection, args=("https://api.powerbi.com/",), daemon=True).start()
+    
+    # One admin token for the whole run, shared by every call below
+    token = get_admin_token()
+    if not token:
+        print("❌ Cannot proceed without an admin token")
+        return
+    
     # Step 1: Get all capacities
-    capacities = get_all_capacities()
+    capacities = get_all_capacities(token)
     
     if not capacities:
         print("❌ Cannot access capacity information")
@@ -273,8 +335,9 @@ def main():
     # Step 2: Identify paused capacities
     paused_capacities, target_capacity_id = identify_paused_capacities(capacities)
     
-    # Check if target capacity is in the list
-    target_capacity = next((c for c in capacities if c.get('id') == target_capacity_id), None)
+    # Check if target capacity is in the list (GUIDs compared case-insensitively)
+    capacities_by_id = {c['id'].lower(): c for c in capacities if c.get('id')}
+    target_capacity = capacities_by_id.get(target_capacity_id.lower())
     
     if not target_capacity:
         print(f"❌ TARGET WORKSPACE CAPACITY NOT FOUND!")
@@ -285,12 +348,12 @@ def main():
         # Ask for confirmation to resume the specific capacity
         response = input(f"\n❓ Attempt to resume target capacity? (y/N): ").lower().strip()
         
-        if response in ['y', 'yes']:
-            success = resume_capacity_powerbi(target_capacity_id, "Target Workspace Capacity")
+        if response in YES_ANSWERS:
+            success = resume_capacity_powerbi(target_capacity_id, "Target Workspace Capacity", token=token)
             
             if success:
                 print(f"\n⏳ Waiting for target capacity to become available...")
-                capacity_ready = wait_for_capacity_resume(target_capacity_id, max_wait_minutes=3)
+                capacity_ready = wait_for_capacity_resume(target_capacity_id, max_wait_minutes=3, token=token)
                 
                 if capacity_ready:
                     print(f"✅ Target capacity successfully resumed and ready")
@@ -310,8 +373,9 @@ def main():
     print(f"🔴 FOUND {len(paused_capacities)} PAUSED CAPACITY(IES)")
     print("=" * 50)
     
-    # Step 3: Resume each paused capacity
+    # Step 3: Confirm which paused capacities to resume
     resumed_count = 0
+    to_resume = []
     
     for capacity in paused_capacities:
         capacity_id = capacity.get('id')
@@ -335,25 +399,30 @@ def main():
             # Ask for confirmation
             response = input(f"\n❓ Resume capacity '{capacity_name}'? (y/N): ").lower().strip()
             
-            if response in ['y', 'yes']:
-                success = resume_capacity_powerbi(capacity_id, capacity_name)
-                
-                if success:
-                    resumed_count += 1
-                    
-                    # Wait for it to become available
-                    print(f"\n⏳ Waiting for {capacity_name} to fully resume...")
-                    capacity_ready = wait_for_capacity_resume(capacity_id, max_wait_minutes=3)
-                    
-                    if capacity_ready:
-                        print(f"✅ {capacity_name} successfully resumed and ready")
-                    else:
-                        print(f"⏰ {capacity_name} resume in progress (may take a few more minutes)")
-                else:
-                    print(f"❌ Failed to resume {capacity_name}")
+            if response in YES_ANSWERS:
+                to_resume.append((capacity_id, capacity_name))
             else:
                 print(f"⏭️  Skipped {capacity_name}")
     
+    # Resume the confirmed capacities concurrently; each one's progress is
+    # buffered and printed as a block once it finishes
+    if to_resume:
+        original_stdout = sys.stdout
+        sys.stdout = ThreadRoutedStdout(original_stdout)
+        try:
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_RESUMES, len(to_resume))) as executor:
+                futures = [
+                    executor.submit(run_captured, lambda c=capacity: resume_and_wait(*c, token=token))
+                    for capacity in to_resume
+                ]
+                for future in as_completed(futures):
+                    success, output = future.result()
+                    print(output, end="")
+                    if success:
+                        resumed_count += 1
+        finally:
+            sys.stdout = original_stdout
+    
     # Step 4: Summary and verification
     print(f"\n📋 RESUME OPERATION SUMMARY")
     print("=" * 40)
@@ -370,7 +439,7 @@ def main():
         # Auto-verify if possible
         verify_dax_execution_after_resume()
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Shared Diagnostic Script Helpers
+Output capture, ETag-cached GETs and response-body helpers used by several troubleshooting scripts
+"""
+
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlencode
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    json_dumps, json_loads = json.dumps, json.loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Start/finish banner timestamps printed by the diagnostic scripts
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def buffered_output(method):
+    """Collect everything a method prints and write it to stdout in one go"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        buffer = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(buffer):
+                return method(*args, **kwargs)
+        finally:
+            sys.stdout.write(buffer.getvalue())
+            sys.stdout.flush()
+    return wrapper
+
+_output = threading.local()
+
+class ThreadRoutedStdout:
+    """Send print output to the current thread's capture buffer, if it has one"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+    
+    def write(self, text):
+        return getattr(_output, "buffer", self.stream).write(text)
+    
+    def flush(self):
+        getattr(_output, "buffer", self.stream).flush()
+
+def run_captured(func):
+    """Run func in the current thread and return (result, printed output)"""
+    _output.buffer = io.StringIO()
+    try:
+        return func(), _output.buffer.getvalue()
+    finally:
+        del _output.buffer
+
+HTTP_CACHE_DIR = os.path.expanduser("~/.nl2dax_http_cache")
+
+def cached_get(session, url, **kwargs):
+    """GET url, revalidating a cached body by ETag; returns (status_code, body)"""
+    # The encoded query string is part of the key, so each params variant gets its own entry
+    params = kwargs.get("params")
+    key = url + "?" + urlencode(sorted(params.items())) if params else url
+    cache_path = os.path.join(HTTP_CACHE_DIR, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+    cached = None
+    try:
+        with open(cache_path, "rb") as f:
+            cached = json_loads(f.read())
+    except (OSError, ValueError):
+        pass
+    
+    headers = dict(kwargs.pop("headers", None) or {})
+    if cached:
+        headers["If-None-Match"] = cached["etag"]
+    
+    response = session.get(url, headers=headers, **kwargs)
+    # Unchanged since the cached copy; hand it back as a normal 200
+    if response.status_code == 304 and cached:
+        return 200, cached["body"].encode("utf-8")
+    
+    etag = response.headers.get("ETag")
+    if response.status_code == 200 and etag:
+        try:
+            os.makedirs(HTTP_CACHE_DIR, mode=0o700, exist_ok=True)
+            fd = os.open(cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"etag": etag, "body": response.content.decode("utf-8", errors="replace")}, f)
+        except OSError:
+            pass
+    return response.status_code, response.content
+
+def iter_values(response):
+    """Yield the items of a streamed OData "value" array one at a time"""
+    if ijson is None:
+        yield from json_loads(response.content).get("value", [])
+        return
+    response.raw.decode_content = True
+    yield from ijson.items(response.raw, "value.item")
+
+def short_body(response, limit=200):
+    """Decode just the start of a streamed response body for error messages"""
+    chunk = next(response.iter_content(chunk_size=2048), b"")
+    response.close()
+    return chunk[:limit].decode("utf-8", errors="replace")
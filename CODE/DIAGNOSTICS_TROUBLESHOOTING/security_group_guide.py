@@ -3,7 +3,9 @@
 Step-by-step guide for creating security groups and enabling XMLA endpoints
 """
 
-print("""
+import sys
+
+GUIDE = """
 🔐 POWER BI SECURITY GROUP SETUP GUIDE
 =====================================
 
@@ -93,4 +95,7 @@ Client ID: 20c5495d-b98c-410b-aa7b-9ea13dd70f61
 Object ID: 41c1b8cc-b650-4313-9543-3527e362694d
 Workspace: FIS (e3fdee99-3aa4-4d71-a530-2964a062e326)
 Dataset: FIS-SEMANTIC-MODEL (3ed8f6b3-0a1d-4910-9d31-a9dd3f8f4007)
-""")
+"""
+
+if __name__ == "__main__":
+    sys.stdout.write(GUIDE + "\n")
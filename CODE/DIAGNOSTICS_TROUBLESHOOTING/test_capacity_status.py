@@ -6,14 +6,40 @@ Wait for capacity to be fully active
 
 import os
 import requests
-import msal
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import random
 import time
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, json_dumps, json_loads
+
 load_dotenv()
 
+# Retry backoff: 10s, 20s, 40s, 40s plus up to 2s of jitter, so the five
+# attempts span about two minutes - long enough for a capacity to spin up
+RETRY_BASE_DELAY = 10.0
+RETRY_MAX_DELAY = 40.0
+RETRY_JITTER = 2.0
+
+# How long a workspace's capacity ID is reused before looking it up again
+CAPACITY_CACHE_TTL = 60
+
+# Fabric capacity states (lowercased) in which DAX queries can run
+READY_STATES = frozenset({'active', 'running'})
+
+# Trivial DAX probe, serialized once at import and resent as-is on every retry
+PROBE_QUERY_BODY = json_dumps({
+    "queries": [{"query": "EVALUATE { 1 }"}],
+    "serializerSettings": {"includeNulls": True}
+})
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter for the given 1-based attempt"""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) + random.uniform(0, RETRY_JITTER)
+
 class CapacityStatusChecker:
     """Check capacity status and wait for it to be ready"""
     
@@ -24,22 +50,25 @@ class CapacityStatusChecker:
         self.workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
         self.dataset_id = os.getenv("POWERBI_DATASET_ID", "fc4d80c8-090e-4441-8336-217490bde820")
         self.token = None
+        self.capacity_ids = {}
+        self.capacity_id = None
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # Reuse keep-alive connections across the status and retry calls;
+        # test_simple_query_with_retry does its own retrying
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=0)))
+        self.session.headers.update({"Content-Type": "application/json"})
+        
     def get_token(self):
         """Get Azure AD token"""
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Reuses a still-valid token persisted by an earlier run
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.session.headers["Authorization"] = f"Bearer {self.token}"
                 return True
             else:
                 print(f"❌ Token failed: {result.get('error_description', 'Unknown')}")
@@ -51,18 +80,23 @@ class CapacityStatusChecker:
     
     def get_workspace_capacity(self):
         """Get workspace capacity ID"""
-        headers = {"Authorization": f"Bearer {self.token}"}
+        cached = self.capacity_ids.get(self.workspace_id)
+        if cached and time.monotonic() - cached[0] < CAPACITY_CACHE_TTL:
+            self.capacity_id = cached[1]
+            return cached[1]
         
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/groups/{self.workspace_id}",
-                headers=headers,
                 timeout=30
             )
             
             if response.status_code == 200:
-                workspace = response.json()
-                return workspace.get('capacityId')
+                workspace = json_loads(response.content)
+                capacity_id = workspace.get('capacityId')
+                self.capacity_ids[self.workspace_id] = (time.monotonic(), capacity_id)
+                self.capacity_id = capacity_id
+                return capacity_id
             else:
                 print(f"❌ Cannot get workspace: {response.status_code}")
                 return None
@@ -73,16 +107,14 @@ class CapacityStatusChecker:
     
     def check_capacity_status_via_fabric(self, capacity_id):
         """Check capacity status using Fabric APIs"""
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         # Try Fabric capacity management API
         fabric_url = f"https://api.fabric.microsoft.com/v1/capacities/{capacity_id}"
         
         try:
-            response = requests.get(fabric_url, headers=headers, timeout=30)
+            response = self.session.get(fabric_url, timeout=30)
             
             if response.status_code == 200:
-                capacity = response.json()
+                capacity = json_loads(response.content)
                 return {
                     "accessible": True,
                     "state": capacity.get('state', 'Unknown'),
@@ -106,33 +138,35 @@ class CapacityStatusChecker:
     
     def test_simple_query_with_retry(self):
         """Test simple query with retry logic"""
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         url = f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/executeQueries"
-        payload = {
-            "queries": [{"query": "EVALUATE { 1 }"}],
-            "serializerSettings": {"includeNulls": True}
-        }
         
         print("🔄 Testing DAX query with retry logic...")
         
         for attempt in range(1, 6):  # 5 attempts
             print(f"   Attempt {attempt}/5...", end="")
             
+            # Don't spend a 60s DAX timeout on a capacity that is still paused;
+            # if the state can't be read, fall through and try the query anyway
+            if self.capacity_id:
+                status = self.check_capacity_status_via_fabric(self.capacity_id)
+                state = status.get('state', '')
+                if status.get('accessible') and state.lower() not in READY_STATES:
+                    print(f" capacity {state}, skipping query")
+                    if attempt < 5:
+                        time.sleep(backoff_delay(attempt))
+                    continue
+            
             try:
-                start_time = time.time()
-                response = requests.post(url, headers=headers, json=payload, timeout=60)
-                elapsed = time.time() - start_time
+                start_time = time.monotonic()
+                response = self.session.post(url, data=PROBE_QUERY_BODY, timeout=60)
+                elapsed = time.monotonic() - start_time
                 
                 print(f" {response.status_code} ({elapsed:.2f}s)")
                 
                 if response.status_code == 200:
                     print("   ✅ SUCCESS! DAX query executed successfully")
                     try:
-                        data = response.json()
+                        data = json_loads(response.content)
                         tables = data.get('results', [{}])[0].get('tables', [])
                         if tables and tables[0].get('rows'):
                             print(f"   📊 Result: {tables[0]['rows'][0]}")
@@ -141,7 +175,7 @@ class CapacityStatusChecker:
                     return True
                 elif response.status_code == 400:
                     try:
-                        error_data = response.json()
+                        error_data = json_loads(response.content)
                         error_code = error_data.get('error', {}).get('code', 'Unknown')
                         error_message = error_data.get('error', {}).get('message', 'No message')
                         print(f"   ❌ Error: {error_code}")
@@ -153,14 +187,14 @@ class CapacityStatusChecker:
                     print(f"   ❌ HTTP {response.status_code}: {response.text[:100]}")
                 
                 if attempt < 5:
-                    wait_time = attempt * 10  # Progressive wait
-                    print(f"   ⏳ Waiting {wait_time}s before retry...")
+                    wait_time = backoff_delay(attempt)
+                    print(f"   ⏳ Waiting {wait_time:.1f}s before retry...")
                     time.sleep(wait_time)
                     
             except Exception as e:
                 print(f"   ❌ Exception: {e}")
                 if attempt < 5:
-                    time.sleep(10)
+                    time.sleep(backoff_delay(attempt))
         
         return False
 
@@ -168,7 +202,7 @@ def main():
     """Main capacity status checking function"""
     print("🏗️  FABRIC CAPACITY STATUS CHECK")
     print("=" * 50)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Verify capacity is ready after resume")
     print()
@@ -219,7 +253,7 @@ def main():
         print("   • Power BI tenant settings")
         print("   • Service principal permissions")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
     return 0 if success else 1
 
@@ -3,27 +3,17 @@
 Test script to verify Power BI service principal permissions
 """
 
-import os
 import requests
-import msal
 from dotenv import load_dotenv
 
+import auth_cache
+
 # Load environment variables
 load_dotenv()
 
 def get_token():
-    tenant_id = os.getenv("PBI_TENANT_ID")
-    client_id = os.getenv("PBI_CLIENT_ID")
-    client_secret = os.getenv("PBI_CLIENT_SECRET")
-    
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
-        client_id,
-        authority=authority,
-        client_credential=client_secret,
-    )
-    
-    token = app.acquire_token_for_client(scopes=["https://analysis.windows.net/powerbi/api/.default"])
+    # Served from the on-disk cache while a previous run's token is still valid
+    token = auth_cache.get_token(auth_cache.PBI_SCOPES)
     if token and "access_token" in token:
         return token["access_token"]
     else:
@@ -6,27 +6,57 @@ Tests specific permissions step by step
 
 import os
 import requests
-import msal
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import json_dumps, json_loads
+
 # Load environment variables
 load_dotenv()
 
+# One keep-alive pool for all five probes instead of a TLS handshake per call
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10, pool_maxsize=10,
+    max_retries=Retry(
+        total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+        # Report the final status and error body instead of raising RetryError
+        raise_on_status=False
+    )
+))
+SESSION.headers["Content-Type"] = "application/json"
+
+# (connect, read): fail fast on an unreachable host, keep the 10s read budget
+PROBE_TIMEOUT = (3.05, 10)
+
+BASE_URL = "https://api.powerbi.com/v1.0/myorg"
+WORKSPACE_ID = os.getenv("POWERBI_WORKSPACE_ID")
+DATASET_ID = "3ed8f6b3-0a1d-4910-9d31-a9dd3f8f4007"
+
+# DAX probe body, serialized once
+DAX_BODY = json_dumps({"queries": [{"query": "EVALUATE { 1 }"}], "serializerSettings": {"includeNulls": True}})
+
+# (name, method, url, body, expected)
+PERMISSION_TESTS = (
+    ("1. List Workspaces (Basic Read)", "GET", f"{BASE_URL}/groups", None,
+     "Should work - basic API access"),
+    ("2. Get Workspace Details", "GET", f"{BASE_URL}/groups/{WORKSPACE_ID}", None,
+     "Should work - workspace access"),
+    ("3. List Datasets in Workspace", "GET", f"{BASE_URL}/groups/{WORKSPACE_ID}/datasets", None,
+     "Should work - dataset read access"),
+    ("4. Get Specific Dataset Info", "GET", f"{BASE_URL}/groups/{WORKSPACE_ID}/datasets/{DATASET_ID}", None,
+     "Should work - dataset metadata access"),
+    ("5. Execute DAX Query (MAIN TEST)", "POST", f"{BASE_URL}/datasets/{DATASET_ID}/executeQueries", DAX_BODY,
+     "Should work - dataset metadata access and DAX execution"),
+)
+
 def get_token():
     """Get Azure AD token"""
-    tenant_id = os.getenv("PBI_TENANT_ID")
-    client_id = os.getenv("PBI_CLIENT_ID")
-    client_secret = os.getenv("PBI_CLIENT_SECRET")
-    
-    app = msal.ConfidentialClientApplication(
-        client_id=client_id,
-        client_credential=client_secret,
-        authority=f"https://login.microsoftonline.com/{tenant_id}"
-    )
-    
-    scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-    result = app.acquire_token_for_client(scopes=scopes)
+    # Served from the persisted cache while the previous token is valid
+    result = auth_cache.get_token(auth_cache.PBI_SCOPES)
     
     if "access_token" in result:
         return result["access_token"]
@@ -34,91 +64,61 @@ def get_token():
         print(f"❌ Token failed: {result}")
         return None
 
+def run_probe(method, url, body):
+    """Send one permission probe on the shared session"""
+    return SESSION.request(method, url, data=body, timeout=PROBE_TIMEOUT)
+
 def test_permission_levels():
     """Test different levels of permissions"""
     token = get_token()
     if not token:
         return
-        
-    workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
-    dataset_id = "3ed8f6b3-0a1d-4910-9d31-a9dd3f8f4007"
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    SESSION.headers["Authorization"] = f"Bearer {token}"
     
     print("🔍 SERVICE PRINCIPAL PERMISSION DIAGNOSTIC")
     print("=" * 55)
     print()
     
-    tests = [
-        {
-            "name": "1. List Workspaces (Basic Read)",
-            "url": "https://api.powerbi.com/v1.0/myorg/groups",
-            "method": "GET",
-            "expected": "Should work - basic API access"
-        },
-        {
-            "name": "2. Get Workspace Details",
-            "url": f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}",
-            "method": "GET", 
-            "expected": "Should work - workspace access"
-        },
-        {
-            "name": "3. List Datasets in Workspace",
-            "url": f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets",
-            "method": "GET",
-            "expected": "Should work - dataset read access"
-        },
-        {
-            "name": "4. Get Specific Dataset Info",
-            "url": f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets/{dataset_id}",
-            "method": "GET",
-            "expected": "Should work - dataset metadata access"
-        },
-        {
-            "name": "5. Execute DAX Query (MAIN TEST)",
-            "url": f"https://api.powerbi.com/v1.0/myorg/datasets/{dataset_id}/executeQueries",
-            "method": "POST",
-            "body": {"queries": [{"query": "EVALUATE { 1 }"}], "serializerSettings": {"includeNulls": True}},
-            "expected": "Should work - dataset metadata access and DAX execution"
-        }
-    ]
+    # The probes don't depend on each other, so send them all at once and
+    # report the results in test order
+    with ThreadPoolExecutor(max_workers=len(PERMISSION_TESTS)) as executor:
+        futures = [
+            executor.submit(run_probe, method, url, body)
+            for _, method, url, body, _ in PERMISSION_TESTS
+        ]
     
-    for test in tests:
-        print(f"🧪 {test['name']}")
-        print(f"   URL: {test['url']}")
+    for (name, _, url, _, expected), future in zip(PERMISSION_TESTS, futures):
+        print(f"🧪 {name}")
+        print(f"   URL: {url}")
         
         try:
-            if test['method'] == 'GET':
-                response = requests.get(test['url'], headers=headers, timeout=10)
-            else:
-                response = requests.post(test['url'], headers=headers, json=test.get('body'), timeout=10)
+            response = future.result()
             
             if response.status_code == 200:
                 print(f"   ✅ SUCCESS: {response.status_code}")
-                if 'List' in test['name']:
-                    data = response.json()
+                if 'List' in name:
+                    data = json_loads(response.content)
                     count = len(data.get('value', []))
                     print(f"   📊 Found {count} items")
             else:
                 print(f"   ❌ FAILED: {response.status_code}")
                 try:
-                    error_info = response.json()
+                    error_info = json_loads(response.content)
                     error_code = error_info.get('error', {}).get('code', 'Unknown')
                     print(f"   🔍 Error: {error_code}")
                 except:
                     print(f"   🔍 Error: {response.text[:100]}")
             
-            print(f"   💡 Expected: {test['expected']}")
+            print(f"   💡 Expected: {expected}")
             print()
             
         except Exception as e:
             print(f"   ❌ EXCEPTION: {e}")
-            print(f"   💡 Expected: {test['expected']}")
+            print(f"   💡 Expected: {expected}")
             print()
     
+    SESSION.close()
 
 
 if __name__ == "__main__":
@@ -5,15 +5,24 @@ Comprehensive troubleshooting for DatasetExecuteQueriesError 400 status
 """
 
 import os
+import sys
+import threading
 import requests
-import msal
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import TIMESTAMP_FORMAT, ThreadRoutedStdout, json_dumps, json_loads, run_captured, short_body
+
 load_dotenv()
 
+# (connect, read): fail fast on an unreachable host, keep 30s for the response
+REQUEST_TIMEOUT = (3.05, 27)
+
 class PowerBIPrerequisitesChecker:
     """Comprehensive checker for Power BI API prerequisites"""
     
@@ -24,25 +33,30 @@ class PowerBIPrerequisitesChecker:
         self.workspace_id = os.getenv("POWERBI_WORKSPACE_ID")
         self.dataset_id = os.getenv("POWERBI_DATASET_ID", "fc4d80c8-090e-4441-8336-217490bde820")
         self.token = None
+        self._workspace = None
+        self._workspace_lock = threading.Lock()
         self.base_url = "https://api.powerbi.com/v1.0/myorg"
         
+        # All checks share one keep-alive connection pool
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=4, pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.5)
+        ))
+        self.session.headers["Content-Type"] = "application/json"
+        
     def get_token(self):
         """Get Azure AD token with detailed validation"""
         print("🔐 AUTHENTICATION CHECK")
         print("-" * 50)
         
         try:
-            app = msal.ConfidentialClientApplication(
-                client_id=self.client_id,
-                client_credential=self.client_secret,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}"
-            )
-            
-            scopes = ["https://analysis.windows.net/powerbi/api/.default"]
-            result = app.acquire_token_for_client(scopes=scopes)
+            # Reuses a still-valid token persisted by an earlier run
+            result = auth_cache.get_token(auth_cache.PBI_SCOPES)
             
             if "access_token" in result:
                 self.token = result["access_token"]
+                self.session.headers["Authorization"] = f"Bearer {self.token}"
                 print("✅ Token acquired successfully")
                 print(f"   Token type: Bearer")
                 print(f"   Expires in: {result.get('expires_in', 'Unknown')} seconds")
@@ -61,28 +75,36 @@ class PowerBIPrerequisitesChecker:
             print()
             return False
     
+    def get_workspace(self):
+        """Look up the target workspace once; returns (status, workspace or None, error text)"""
+        # Two checks may ask at the same time; only one of them fetches
+        with self._workspace_lock:
+            if self._workspace is None:
+                # Ask the API for just the target workspace instead of listing
+                # every workspace the service principal can see
+                response = self.session.get(
+                    f"{self.base_url}/groups",
+                    params={"$filter": f"id eq '{self.workspace_id}'", "$top": 1},
+                    timeout=REQUEST_TIMEOUT,
+                    stream=True
+                )
+                
+                if response.status_code == 200:
+                    matches = json_loads(response.content).get('value', [])
+                    self._workspace = (200, matches[0] if matches else None, "")
+                else:
+                    self._workspace = (response.status_code, None, short_body(response))
+            return self._workspace
+    
     def check_workspace_access(self):
         """Check workspace accessibility"""
         print("🏢 WORKSPACE ACCESS CHECK")
         print("-" * 50)
         
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         try:
-            # List all workspaces
-            response = requests.get(f"{self.base_url}/groups", headers=headers, timeout=30)
+            status, target_workspace, error_text = self.get_workspace()
             
-            if response.status_code == 200:
-                workspaces = response.json().get('value', [])
-                print(f"✅ Can access {len(workspaces)} workspaces")
-                
-                # Find our specific workspace
-                target_workspace = None
-                for ws in workspaces:
-                    if ws['id'] == self.workspace_id:
-                        target_workspace = ws
-                        break
-                
+            if status == 200:
                 if target_workspace:
                     print(f"✅ Target workspace found")
                     print(f"   Name: {target_workspace.get('name', 'Unknown')}")
@@ -94,15 +116,19 @@ class PowerBIPrerequisitesChecker:
                 else:
                     print(f"❌ Target workspace not found")
                     print(f"   Looking for: {self.workspace_id}")
-                    print(f"   Available workspaces:")
-                    for ws in workspaces[:5]:  # Show first 5
-                        print(f"     - {ws.get('name', 'Unknown')} ({ws['id']})")
+                    
+                    # Only now fetch a few workspaces for the hint
+                    hint = self.session.get(f"{self.base_url}/groups", params={"$top": 5}, timeout=REQUEST_TIMEOUT)
+                    if hint.status_code == 200:
+                        print(f"   Available workspaces:")
+                        for ws in json_loads(hint.content).get('value', []):
+                            print(f"     - {ws.get('name', 'Unknown')} ({ws['id']})")
                     print()
                     return False
             else:
                 print(f"❌ Cannot list workspaces")
-                print(f"   Status: {response.status_code}")
-                print(f"   Error: {response.text[:200]}")
+                print(f"   Status: {status}")
+                print(f"   Error: {error_text}")
                 print()
                 return False
                 
@@ -116,18 +142,16 @@ class PowerBIPrerequisitesChecker:
         print("📊 DATASET ACCESS CHECK")
         print("-" * 50)
         
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         try:
             # Check dataset in workspace
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}",
-                headers=headers,
-                timeout=30
+                timeout=REQUEST_TIMEOUT,
+                stream=True
             )
             
             if response.status_code == 200:
-                dataset = response.json()
+                dataset = json_loads(response.content)
                 print("✅ Dataset accessible")
                 print(f"   Name: {dataset.get('name', 'Unknown')}")
                 print(f"   ID: {dataset['id']}")
@@ -146,10 +170,10 @@ class PowerBIPrerequisitesChecker:
                     print("     - Incorrect dataset ID")
                     print("     - No permission to view dataset")
                 try:
-                    error_data = response.json()
+                    error_data = json_loads(response.content)
                     print(f"   Error: {error_data}")
                 except:
-                    print(f"   Raw response: {response.text[:200]}")
+                    print(f"   Raw response: {short_body(response)}")
                 print()
                 return False
                 
@@ -163,18 +187,16 @@ class PowerBIPrerequisitesChecker:
         print("🔒 DATASET PERMISSIONS & CAPACITY CHECK")
         print("-" * 50)
         
-        headers = {"Authorization": f"Bearer {self.token}"}
-        
         try:
             # Get dataset refresh history to check permissions
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/groups/{self.workspace_id}/datasets/{self.dataset_id}/refreshes",
-                headers=headers,
-                timeout=30
+                timeout=REQUEST_TIMEOUT,
+                stream=True
             )
             
             if response.status_code == 200:
-                refreshes = response.json().get('value', [])
+                refreshes = json_loads(response.content).get('value', [])
                 print(f"✅ Can access refresh history ({len(refreshes)} entries)")
                 if refreshes:
                     latest = refreshes[0]
@@ -182,30 +204,25 @@ class PowerBIPrerequisitesChecker:
                     print(f"   Status: {latest.get('status', 'Unknown')}")
             else:
                 print(f"⚠️  Cannot access refresh history (Status: {response.status_code})")
+                response.close()
             
-            # Check workspace capacity
-            response = requests.get(
-                f"{self.base_url}/groups/{self.workspace_id}",
-                headers=headers,
-                timeout=30
-            )
+            # Check workspace capacity, reusing the workspace access lookup
+            _, workspace, _ = self.get_workspace()
             
-            if response.status_code == 200:
-                workspace = response.json()
+            if workspace:
                 capacity_id = workspace.get('capacityId')
                 if capacity_id:
                     print(f"✅ Workspace has capacity assigned")
                     print(f"   Capacity ID: {capacity_id}")
                     
                     # Check capacity details
-                    cap_response = requests.get(
+                    cap_response = self.session.get(
                         f"{self.base_url}/capacities/{capacity_id}",
-                        headers=headers,
-                        timeout=30
+                        timeout=REQUEST_TIMEOUT
                     )
                     
                     if cap_response.status_code == 200:
-                        capacity = cap_response.json()
+                        capacity = json_loads(cap_response.content)
                         print(f"   Capacity admins: {len(capacity.get('admins', []))}")
                         print(f"   Display name: {capacity.get('displayName', 'Unknown')}")
                     else:
@@ -222,16 +239,15 @@ class PowerBIPrerequisitesChecker:
             print()
             return False
     
+    def close(self):
+        """Release the pooled connections"""
+        self.session.close()
+    
     def test_minimal_query(self):
         """Test the simplest possible DAX query"""
         print("🧪 MINIMAL DAX QUERY TEST")
         print("-" * 50)
         
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
-        
         # Test increasingly complex queries
         test_queries = [
             ("Empty Evaluation", "EVALUATE { 1 }"),
@@ -252,7 +268,7 @@ class PowerBIPrerequisitesChecker:
             
             try:
                 start_time = time.time()
-                response = requests.post(url, headers=headers, json=payload, timeout=30)
+                response = self.session.post(url, data=json_dumps(payload), timeout=REQUEST_TIMEOUT)
                 elapsed = time.time() - start_time
                 
                 print(f"   Status: {response.status_code}")
@@ -261,7 +277,7 @@ class PowerBIPrerequisitesChecker:
                 if response.status_code == 200:
                     print("   Result: ✅ SUCCESS")
                     try:
-                        data = response.json()
+                        data = json_loads(response.content)
                         tables = data.get('results', [{}])[0].get('tables', [])
                         if tables:
                             rows = tables[0].get('rows', [])
@@ -271,7 +287,7 @@ class PowerBIPrerequisitesChecker:
                 else:
                     print("   Result: ❌ FAILED")
                     try:
-                        error_data = response.json()
+                        error_data = json_loads(response.content)
                         error_code = error_data.get('error', {}).get('code', 'Unknown')
                         error_msg = error_data.get('error', {}).get('message', 'No message')
                         print(f"   Error code: {error_code}")
@@ -286,7 +302,7 @@ class PowerBIPrerequisitesChecker:
                             print("   🔍 AUTHENTICATION ISSUE DETECTED")
                         
                     except:
-                        print(f"   Raw error: {response.text[:200]}")
+                        print(f"   Raw error: {short_body(response)}")
                 
                 print()
                 
@@ -304,7 +320,7 @@ def main():
     """Main prerequisites checking function"""
     print("🔍 POWER BI DAX EXECUTION PREREQUISITES CHECK")
     print("=" * 70)
-    print(f"🕐 Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"🕐 Started at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     print()
     print("📋 Purpose: Diagnose DatasetExecuteQueriesError 400 status")
     print("   Check all prerequisites for DAX query execution")
@@ -327,20 +343,35 @@ def main():
         return 1
     
     # Run all checks
-    checks = [
-        ("Authentication", checker.get_token),
+    independent_checks = [
         ("Workspace Access", checker.check_workspace_access),
         ("Dataset Access", checker.check_dataset_access),
         ("Permissions & Capacity", checker.check_dataset_permissions),
-        ("DAX Query Execution", checker.test_minimal_query),
     ]
     
-    results = {}
+    results = {"Authentication": checker.get_token()}
     
-    for check_name, check_func in checks:
-        if check_name == "Authentication" or results.get("Authentication", False):
-            results[check_name] = check_func()
-        else:
+    if results["Authentication"]:
+        # These three only need the token, so run them concurrently and print
+        # each one's buffered output in the usual order
+        original_stdout = sys.stdout
+        sys.stdout = ThreadRoutedStdout(original_stdout)
+        try:
+            with ThreadPoolExecutor(max_workers=len(independent_checks)) as executor:
+                futures = [
+                    (check_name, executor.submit(run_captured, check_func))
+                    for check_name, check_func in independent_checks
+                ]
+                for check_name, future in futures:
+                    results[check_name], output = future.result()
+                    print(output, end="")
+        finally:
+            sys.stdout = original_stdout
+        
+        # The DAX query is the final gate, run once the others are done
+        results["DAX Query Execution"] = checker.test_minimal_query()
+    else:
+        for check_name in [name for name, _ in independent_checks] + ["DAX Query Execution"]:
             print(f"⏭️  Skipping {check_name} (Authentication failed)")
             results[check_name] = False
     
@@ -390,8 +421,9 @@ def main():
             print("  - Review error messages above")
             print("  - Most likely capacity or permission issue")
     
-    print(f"\n⏰ Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"\n⏰ Completed at: {datetime.now().strftime(TIMESTAMP_FORMAT)}")
     
+    checker.close()
     return 0 if all_passed else 1
 
 if __name__ == "__main__":
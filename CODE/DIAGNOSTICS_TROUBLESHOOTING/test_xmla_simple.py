@@ -5,25 +5,17 @@ Simple test script to replicate the exact XMLA request from the shell script
 
 import os
 import requests
-import msal
 from dotenv import load_dotenv
 
+import auth_cache
+from script_helpers import json_dumps
+
 # Load environment variables
 load_dotenv()
 
 def get_token():
-    tenant_id = os.getenv("PBI_TENANT_ID")
-    client_id = os.getenv("PBI_CLIENT_ID")
-    client_secret = os.getenv("PBI_CLIENT_SECRET")
-    
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
-        client_id,
-        authority=authority,
-        client_credential=client_secret,
-    )
-    
-    token = app.acquire_token_for_client(scopes=["https://analysis.windows.net/powerbi/api/.default"])
+    # Served from the on-disk cache while a previous run's token is still valid
+    token = auth_cache.get_token(auth_cache.PBI_SCOPES)
     if token and "access_token" in token:
         return token["access_token"]
     else:
@@ -59,26 +51,9 @@ def test_dax_via_rest_api():
     
     response = requests.post(
         endpoint,
-        json=dax_query,
-        headers=headers,
-        timeout=60
-    )
-    
-    print(f"[DEBUG] Response status: {response.status_code}")
-    print(f"[DEBUG] Response headers: {dict(response.headers)}")
-    print(f"[DEBUG] Response body: {response.text[:1000]}")
-    
-    return response
-    
-    print(f"[DEBUG] Making request to: {endpoint}")
-    print(f"[DEBUG] Catalog: {dataset_name}")
-    print(f"[DEBUG] Request body length: {len(xmla_discover)}")
-    
-    response = requests.post(
-        endpoint,
-        data=xmla_discover.encode('utf-8'),
+        data=json_dumps(dax_query),
         headers=headers,
-        timeout=60
+        timeout=(3.05, 60)
     )
     
     print(f"[DEBUG] Response status: {response.status_code}")
@@ -0,0 +1,44 @@
+"""
+Tests for the refresh fixer's rejected-parameter detection
+"""
+import unittest
+import sys
+import os
+
+# Add the parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fix_semantic_model_refresh import rejected_parameters
+
+REFRESH_KEYS = {"notifyOption", "type"}
+
+class TestRejectedParameters(unittest.TestCase):
+    """Test cases for rejected_parameters"""
+
+    def test_unrelated_message_keeps_parameters(self):
+        """A generic 400 that merely contains a key's text rejects nothing"""
+        error = {
+            "code": "InvalidRequest",
+            "message": "Content-Type header is invalid: type mismatch in request body"
+        }
+
+        self.assertEqual(rejected_parameters(error, REFRESH_KEYS), set())
+
+    def test_quoted_parameter_is_rejected(self):
+        """A parameter the message names in quotes is rejected"""
+        error = {"code": "InvalidRequest", "message": "Parameter 'type' is not supported for this dataset"}
+
+        self.assertEqual(rejected_parameters(error, REFRESH_KEYS), {"type"})
+
+    def test_detail_target_is_rejected(self):
+        """A parameter named as an error detail's target is rejected"""
+        error = {
+            "code": "InvalidRequest",
+            "message": "The request is invalid",
+            "details": [{"code": "InvalidParameter", "target": "notifyOption"}]
+        }
+
+        self.assertEqual(rejected_parameters(error, REFRESH_KEYS), {"notifyOption"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -70,21 +70,189 @@ Last Updated: August 14, 2025
 from __future__ import annotations
 
 # Standard library imports for core functionality
+import io            # In-memory byte streams for incremental XML parsing
 import os            # Operating system interface for environment variable access
+import random        # Jitter for retry backoff delays
 import time          # Time utilities for retry delays and timing operations
+import threading     # Lock guarding the process-wide MSAL app and token caches
+from concurrent.futures import ThreadPoolExecutor  # Overlapping independent DAX queries
 import xml.etree.ElementTree as ET  # XML parsing for SOAP response processing
-from typing import List, Dict, Optional  # Type hints for improved code clarity
+from typing import List, Dict, Optional, Tuple, Union  # Type hints for improved code clarity
 
 # Third-party imports for external service integration
 import msal          # Microsoft Authentication Library for Azure AD authentication
 import requests      # HTTP client library for REST API and SOAP communication
+from requests.adapters import HTTPAdapter  # Connection pool sizing for the shared session
 import json          # JSON encoding/decoding for API data interchange
 from dotenv import load_dotenv  # Environment variable loading from .env files
 
+# Optional: orjson parses large executeQueries results several times faster
+# than the stdlib json module; both accept the raw response bytes
+try:
+    from orjson import dumps as json_dumps, loads as json_loads  # Fast JSON (optional)
+except ImportError:
+    json_dumps, json_loads = json.dumps, json.loads
+
+# Optional: lxml's C iterparse is several times faster on large rowsets;
+# the stdlib parser is used when it isn't installed
+try:
+    from lxml import etree as _row_parser  # Fast streaming XML parser (optional)
+    _XML_PARSE_ERRORS = (ET.ParseError, _row_parser.XMLSyntaxError)
+except ImportError:
+    _row_parser = ET
+    _XML_PARSE_ERRORS = (ET.ParseError,)
+
 # Load environment variables from .env file for secure configuration management
 # This ensures sensitive credentials are not hardcoded in the source code
 load_dotenv()
 
+# OAuth scope for the Power BI Service API (used by both XMLA and REST execution)
+POWERBI_SCOPES = ["https://analysis.windows.net/powerbi/api/.default"]
+
+# Refresh access tokens this many seconds before Azure AD says they expire
+TOKEN_EXPIRY_MARGIN = 60
+
+# Retry backoff: base_delay * 2**attempt stretched by up to BACKOFF_JITTER (fraction)
+# so concurrent callers don't retry in lockstep, then capped at BACKOFF_MAX_DELAY
+BACKOFF_MAX_DELAY = 30.0
+BACKOFF_JITTER = 0.5
+
+# Process-wide authentication state, keyed by (tenant_id, client_id).
+# Building a ConfidentialClientApplication fetches the tenant's OpenID metadata,
+# and every acquire_token_for_client() miss is a round-trip to Azure AD, so both
+# the app and the last issued token are kept for the lifetime of the process
+# and shared by every XmlaHttpClient and get_access_token() caller.
+_MSAL_APP_CACHE: Dict[Tuple[str, str], msal.ConfidentialClientApplication] = {}
+_TOKEN_CACHE: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_TOKEN_LOCK = threading.Lock()
+
+# Keep-alive HTTPS session shared by XMLA SOAP and Power BI REST calls.
+# A fresh Session per query meant a new TCP + TLS handshake for each of the
+# groups, datasets and executeQueries requests; pooled connections skip that.
+# Authorization is passed per request because clients for different tenants
+# may share this session.
+_SHARED_SESSION = requests.Session()
+_SHARED_SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+# Seconds a workspace/dataset name -> ID resolution is reused before listing again
+RESOLVE_CACHE_TTL = 600
+
+# (tenant_id, lowercased connection, dataset name, dataset ID) -> (workspace_id, dataset_id, resolved_at)
+_RESOLVE_CACHE: Dict[Tuple[str, str, str, Optional[str]], Tuple[str, str, float]] = {}
+
+# Namespace prefix of XMLA tabular rowset elements, and the qualified row tag
+XMLA_ROWSET_NS = "{urn:schemas-microsoft-com:xml-analysis:rowset}"
+XMLA_ROW_TAG = XMLA_ROWSET_NS + "row"
+
+# XMLA SOAP Execute envelope; filled with (dax_query, database) per call
+XMLA_EXECUTE_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<Envelope xmlns="http://schemas.xmlsoap.org/soap/envelope/">
+  <Body>
+    <Execute xmlns="urn:schemas-microsoft-com:xml-analysis">
+      <Command>
+        <Statement>%s</Statement>
+      </Command>
+      <Properties>
+        <PropertyList>
+          <Catalog>%s</Catalog>
+          <Format>Tabular</Format>
+        </PropertyList>
+      </Properties>
+    </Execute>
+  </Body>
+</Envelope>"""
+
+
+def _backoff_delay(attempt: int, base_delay: float, resp: Optional[requests.Response] = None, cap: float = BACKOFF_MAX_DELAY) -> float:
+    """
+    Compute how long to wait before retry number attempt + 1.
+    
+    A Retry-After header (in seconds) on the failed response wins, as Azure AD and
+    Power BI send one with 429/503 throttling responses, but is still capped at cap.
+    Otherwise the delay is exponential, jittered by up to BACKOFF_JITTER and then capped at cap.
+    
+    Args:
+        attempt (int): Zero-based index of the attempt that just failed
+        base_delay (float): Delay in seconds after the first failure
+        resp (Optional[requests.Response]): Failed response, if one was received
+        cap (float): Upper bound in seconds for any delay, Retry-After included
+    
+    Returns:
+        float: Seconds to sleep before the next attempt
+    """
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.strip().isdigit():
+            return min(cap, float(retry_after))
+    
+    return min(cap, base_delay * (2 ** attempt) * (1 + random.random() * BACKOFF_JITTER))
+
+
+def _body_preview(resp: requests.Response, limit: int) -> str:
+    """
+    Decode only the first limit bytes of a response body for log and error messages.
+    
+    resp.text decodes the whole body (and may run charset detection on it) even
+    when only a short prefix is shown, which is wasteful on large HTML error pages.
+    
+    Args:
+        resp (requests.Response): Response whose body to preview
+        limit (int): Maximum number of bytes to decode
+    
+    Returns:
+        str: Decoded prefix, with undecodable bytes replaced
+    """
+    return resp.content[:limit].decode("utf-8", errors="replace")
+
+
+def _acquire_cached_token(tenant_id: str, client_id: str, client_secret: str, force_refresh: bool = False) -> Dict:
+    """
+    Return an MSAL token result for the Power BI Service API, reusing cached state.
+    
+    Lookup order:
+    1. Token issued earlier in this process that is still valid (no MSAL call)
+    2. MSAL in-memory token cache via acquire_token_silent()
+    3. Azure AD token endpoint via acquire_token_for_client()
+    
+    Args:
+        tenant_id (str): Azure AD tenant ID
+        client_id (str): Service principal application (client) ID
+        client_secret (str): Service principal client secret
+        force_refresh (bool): Skip steps 1-2 and go straight to Azure AD
+    
+    Returns:
+        Dict: MSAL result; contains "access_token" on success, or the MSAL
+              error fields (error, error_description) on failure.
+    """
+    key = (tenant_id, client_id)
+    
+    # Serialize acquisition so concurrent callers don't all miss and hit Azure AD
+    with _TOKEN_LOCK:
+        cached = None if force_refresh else _TOKEN_CACHE.get(key)
+        if cached and time.monotonic() < cached[1] - TOKEN_EXPIRY_MARGIN:
+            return {"access_token": cached[0]}
+        
+        app = _MSAL_APP_CACHE.get(key)
+        if app is None:
+            app = msal.ConfidentialClientApplication(
+                client_id,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                client_credential=client_secret,
+                token_cache=msal.TokenCache(),
+            )
+            _MSAL_APP_CACHE[key] = app
+        
+        # Client-credential tokens have no user account; account=None checks the app cache
+        result = None if force_refresh else app.acquire_token_silent(POWERBI_SCOPES, account=None)
+        if not result or "access_token" not in result:
+            result = app.acquire_token_for_client(scopes=POWERBI_SCOPES)
+        
+        if result and "access_token" in result:
+            expires_in = float(result.get("expires_in") or 0)
+            _TOKEN_CACHE[key] = (result["access_token"], time.monotonic() + expires_in)
+        
+        return result
+
 
 class XmlaHttpError(RuntimeError):
     """
@@ -175,10 +343,11 @@ class XmlaHttpClient:
         self.xmla_endpoint = xmla_endpoint
         self.database = database
         
-        # Initialize HTTP session for connection pooling and performance optimization
-        self._session = requests.Session()
+        # Use the process-wide pooled session so short-lived clients (one per
+        # execute_dax_via_http call) still reuse warm HTTPS connections
+        self._session = _SHARED_SESSION
 
-    def _get_token(self, attempts: int = 3, base_delay: float = 1.0) -> str:
+    def _get_token(self, attempts: int = 3, base_delay: float = 1.0, force_refresh: bool = False) -> str:
         """
         Acquire Azure AD access token for Power BI Service API with retry logic.
         
@@ -188,15 +357,17 @@ class XmlaHttpClient:
         enterprise-grade token acquisition and management.
         
         Token Acquisition Process:
-        1. Construct Azure AD authority URL using tenant ID
-        2. Create MSAL confidential client application with service principal credentials
-        3. Request access token with appropriate scopes for Power BI Service API
+        1. Reuse a still-valid token issued earlier in this process, if any
+        2. Reuse the process-wide MSAL confidential client for this tenant/client
+        3. Try the MSAL token cache, then request a new token from Azure AD
         4. Implement exponential backoff retry strategy for transient failures
         5. Return valid access token for API authentication
         
         Args:
             attempts (int): Maximum number of retry attempts (default: 3)
             base_delay (float): Base delay in seconds for exponential backoff (default: 1.0)
+            force_refresh (bool): Skip cached tokens and request a new one from Azure AD,
+                                  e.g. after the endpoint rejected the current token (default: False)
         
         Returns:
             str: Valid Azure AD access token for Power BI Service API authentication
@@ -206,7 +377,7 @@ class XmlaHttpClient:
                          including detailed error information for troubleshooting
         
         Retry Strategy:
-            - Exponential backoff: delay = base_delay * (2 ** attempt_number)
+            - Exponential backoff: delay = base_delay * (2 ** attempt_number), jittered and capped
             - Handles transient Azure AD service issues
             - Accounts for network connectivity problems
             - Manages temporary service principal permission issues
@@ -215,23 +386,15 @@ class XmlaHttpClient:
             >>> token = client._get_token(attempts=3, base_delay=1.0)
             >>> # Token can be used for subsequent API calls
         """
-        # Construct Azure AD authority URL for the specified tenant
-        authority = f"https://login.microsoftonline.com/{self.tenant_id}"
-        
-        # Create MSAL confidential client application for service principal authentication
-        app = msal.ConfidentialClientApplication(
-            self.client_id,                    # Service principal application ID
-            authority=authority,               # Azure AD tenant-specific authority
-            client_credential=self.client_secret,  # Service principal secret
-        )
-        
         # Track last error for detailed error reporting
         last_err = None
         
         # Implement retry logic with exponential backoff
         for i in range(attempts):
-            # Request access token with Power BI Service API scope
-            token = app.acquire_token_for_client(scopes=["https://analysis.windows.net/powerbi/api/.default"])
+            # Request access token with Power BI Service API scope (cached across calls)
+            token = _acquire_cached_token(
+                self.tenant_id, self.client_id, self.client_secret, force_refresh=force_refresh
+            )
             
             # Check for successful token acquisition
             if token and "access_token" in token:
@@ -240,8 +403,9 @@ class XmlaHttpClient:
             # Store error details for potential retry or final failure reporting
             last_err = token
             
-            # Implement exponential backoff delay before retry
-            time.sleep(base_delay * (2 ** i))
+            # Implement jittered exponential backoff before retry (not after the last attempt)
+            if i < attempts - 1:
+                time.sleep(_backoff_delay(i, base_delay))
         
         # All retry attempts failed, raise detailed error
         raise RuntimeError(
@@ -318,30 +482,16 @@ class XmlaHttpClient:
                 workspace_connection=self.xmla_endpoint,
                 dataset_name=self.database,
                 dax_query=dax_query,
+                session=self._session,
             )
 
         print(f"[DEBUG] Using XMLA SOAP over HTTP for endpoint: {self.xmla_endpoint}")
         # Route to SOAP/XMLA execution for universal XMLA endpoint compatibility
         
-        # Build XMLA SOAP request body for DAX query execution
-        xmla_body = f"""<?xml version="1.0" encoding="utf-8"?>
-<Envelope xmlns="http://schemas.xmlsoap.org/soap/envelope/">
-  <Body>
-    <Execute xmlns="urn:schemas-microsoft-com:xml-analysis">
-      <Command>
-        <Statement>{dax_query}</Statement>
-      </Command>
-      <Properties>
-        <PropertyList>
-          <Catalog>{self.database}</Catalog>
-          <Format>Tabular</Format>
-        </PropertyList>
-      </Properties>
-    </Execute>
-  </Body>
-</Envelope>"""
+        # Build and encode the XMLA SOAP request body once; retries resend the same bytes
+        xmla_body = (XMLA_EXECUTE_TEMPLATE % (dax_query, self.database)).encode("utf-8")
         
-        # Prepare authentication headers with Azure AD bearer token
+        # Prepare authentication headers with Azure AD bearer token (reused across retries)
         headers = {
             "Content-Type": "text/xml; charset=utf-8",
             "Authorization": f"Bearer {self._get_token()}",
@@ -354,47 +504,56 @@ class XmlaHttpClient:
 
         # Execute with retry logic for transient failures
         last_exc: Optional[Exception] = None
+        token_refreshed = False
         for i in range(attempts):
+            resp = None  # Stays None on network errors (no Retry-After to honor)
             try:
                 # Send the XMLA SOAP request
                 resp = self._session.post(
                     self.xmla_endpoint,
-                    data=xmla_body.encode("utf-8"),
+                    data=xmla_body,
                     headers=headers,
                     timeout=60,
                 )
                 
                 # Handle HTTP errors and parse SOAP faults
                 if resp.status_code >= 400:
-                    fault = try_parse_soap_fault(resp.text)
+                    fault = try_parse_soap_fault(resp.content)
                     extra_hint = hint_for_status(resp.status_code)
-                    print(f"[DEBUG] Full XMLA error response: {resp.text[:1000]}")
+                    print(f"[DEBUG] Full XMLA error response: {_body_preview(resp, 1000)}")
                     raise XmlaHttpError(
                         message=(
                             f"HTTP {resp.status_code} calling XMLA endpoint. {extra_hint}\n"
                             f"Endpoint: {self.xmla_endpoint}\nDatabase: {self.database}\n"
-                            f"Details: {fault or resp.text[:500]}"
+                            f"Details: {fault or _body_preview(resp, 500)}"
                         ),
                         status_code=resp.status_code,
                     )
                 
-                # Parse and return successful response
-                return parse_xmla_response(resp.text)
+                # Parse and return successful response (raw bytes, no full-body decode)
+                return parse_xmla_response(resp.content)
                 
             except (requests.Timeout, requests.ConnectionError) as e:
                 last_exc = e
                 print(f"[DEBUG] Network error (attempt {i+1}/{attempts}): {e}")
             except XmlaHttpError as e:
+                # The token may have been revoked or expired early: fetch a new one once
+                if e.status_code == 401 and not token_refreshed and i < attempts - 1:
+                    print("[DEBUG] HTTP 401 from XMLA endpoint, refreshing access token and retrying...")
+                    headers["Authorization"] = f"Bearer {self._get_token(force_refresh=True)}"
+                    token_refreshed = True
+                    last_exc = e
+                    continue
                 # Don't retry non-transient errors (400, 401, 403, etc.)
                 if not is_transient_status(e.status_code):
                     raise
                 last_exc = e
                 print(f"[DEBUG] Transient error (attempt {i+1}/{attempts}): {e}")
             
-            # Exponential backoff for retries
+            # Exponential backoff for retries, or the server's Retry-After if given
             if i < attempts - 1:  # Don't sleep after the last attempt
-                sleep_time = base_delay * (2 ** i)
-                print(f"[DEBUG] Retrying in {sleep_time} seconds...")
+                sleep_time = _backoff_delay(i, base_delay, resp)
+                print(f"[DEBUG] Retrying in {sleep_time:.1f} seconds...")
                 time.sleep(sleep_time)
         
         # All retry attempts exhausted
@@ -410,8 +569,8 @@ def get_access_token(tenant_id: str, client_id: str, client_secret: str, attempt
     Authentication Library (MSAL) for Python to handle the authentication flow securely.
     
     Authentication Flow:
-    1. Creates a confidential client application using tenant and service principal credentials
-    2. Requests an access token with Power BI Service scope
+    1. Reuses the process-wide confidential client application for the tenant/client pair
+    2. Returns a cached token while it is valid, otherwise requests one with Power BI Service scope
     3. Handles token acquisition failures with exponential backoff retry logic
     4. Returns the bearer token for use in Authorization headers
     
@@ -458,25 +617,13 @@ def get_access_token(tenant_id: str, client_id: str, client_secret: str, attempt
         ... )
         >>> headers = {"Authorization": f"Bearer {token}"}
     """
-    # Build Azure AD authority endpoint for the specified tenant
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    
-    # Create MSAL confidential client application for service principal authentication
-    app = msal.ConfidentialClientApplication(
-        client_id=client_id,
-        authority=authority,
-        client_credential=client_secret
-    )
-    
     # Execute token acquisition with retry logic for transient failures
     last_err = None
     for i in range(attempts):
         try:
             # Request access token using client credentials flow
-            # Scope specifies Power BI Service API access
-            token_result = app.acquire_token_for_client(
-                scopes=["https://analysis.windows.net/powerbi/api/.default"]
-            )
+            # Served from the process-wide cache until shortly before expiry
+            token_result = _acquire_cached_token(tenant_id, client_id, client_secret)
             
             # Check if token acquisition was successful
             if token_result and "access_token" in token_result:
@@ -493,8 +640,8 @@ def get_access_token(tenant_id: str, client_id: str, client_secret: str, attempt
         
         # Apply exponential backoff for retries (except on last attempt)
         if i < attempts - 1:
-            sleep_time = base_delay * (2 ** i)
-            print(f"[DEBUG] Retrying token acquisition in {sleep_time} seconds...")
+            sleep_time = _backoff_delay(i, base_delay)
+            print(f"[DEBUG] Retrying token acquisition in {sleep_time:.1f} seconds...")
             time.sleep(sleep_time)
     
     # All retry attempts exhausted
@@ -505,7 +652,128 @@ def get_access_token(tenant_id: str, client_id: str, client_secret: str, attempt
     )
 
 
-def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str, workspace_connection: str, dataset_name: str, dax_query: str, dataset_id: Optional[str] = None) -> List[Dict]:
+def _index_by_name(items: List[Dict]) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Index Power BI API items (workspaces, datasets) by exact and lowercased name.
+    
+    Built in one pass so the exact and case-insensitive lookups are both O(1).
+    The first item wins when names collide, matching a linear first-match scan.
+    
+    Args:
+        items (List[Dict]): The "value" list from a Power BI list endpoint
+    
+    Returns:
+        Tuple[Dict[str, Dict], Dict[str, Dict]]: (by_name, by_lowercased_name)
+    """
+    by_name: Dict[str, Dict] = {}
+    by_lower_name: Dict[str, Dict] = {}
+    for item in items:
+        name = str(item.get("name", ""))
+        by_name.setdefault(name, item)
+        by_lower_name.setdefault(name.lower(), item)
+    return by_name, by_lower_name
+
+
+def _resolve_workspace_and_dataset(session: requests.Session, headers: Dict[str, str], workspace_name: str, dataset_name: str, dataset_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Resolve a Power BI workspace name and dataset name/ID to their group and dataset IDs.
+    
+    Lists the workspaces visible to the service principal, then the datasets in the
+    matched workspace. Names are matched exactly first, then case-insensitively.
+    
+    Args:
+        session (requests.Session): HTTP session to send the requests on
+        headers (Dict[str, str]): Request headers including the bearer token
+        workspace_name (str): Workspace display name parsed from the powerbi:// connection
+        dataset_name (str): Dataset display name to resolve when no ID is given
+        dataset_id (Optional[str]): Known dataset ID; validated against the workspace
+    
+    Returns:
+        Tuple[str, str]: (workspace_id, dataset_id)
+    
+    Raises:
+        RuntimeError: When a listing request fails or the workspace or dataset cannot be found
+    """
+    # Step 1: Resolve workspace (group) ID by name
+    print(f"[DEBUG] Resolving workspace ID for workspace: '{workspace_name}'...")
+    groups_url = "https://api.powerbi.com/v1.0/myorg/groups"
+    resp = session.get(groups_url, headers=headers, timeout=60)
+    if resp.status_code >= 400:
+        raise RuntimeError(
+            f"Power BI Groups API failed with HTTP {resp.status_code}. "
+            f"Error details: {_body_preview(resp, 500) or 'No error details available'}"
+        )
+    
+    groups_data = json_loads(resp.content)
+    groups = groups_data.get("value", [])
+    
+    # Index workspaces by name once, then look up exact match first
+    groups_by_name, groups_by_lower_name = _index_by_name(groups)
+    workspace = groups_by_name.get(workspace_name)
+    
+    # Fallback to case-insensitive lookup if exact match not found
+    if not workspace:
+        print(f"[DEBUG] Exact match not found, trying case-insensitive search...")
+        workspace = groups_by_lower_name.get(workspace_name.lower())
+    
+    if not workspace:
+        available_workspaces = [g.get("name", "Unknown") for g in groups]
+        raise RuntimeError(
+            f"Workspace '{workspace_name}' not found. "
+            f"Available workspaces: {', '.join(sorted(available_workspaces))}"
+        )
+    
+    workspace_id = workspace.get("id")
+    print(f"[DEBUG] Found workspace '{workspace_name}' with ID: {workspace_id}")
+
+    # Step 2: Resolve dataset ID by name or use provided ID
+    print(f"[DEBUG] Resolving dataset in workspace '{workspace_name}'...")
+    datasets_url = f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets"
+    datasets_resp = session.get(datasets_url, headers=headers, timeout=60)
+    if datasets_resp.status_code >= 400:
+        raise RuntimeError(
+            f"Power BI Datasets API failed with HTTP {datasets_resp.status_code}. "
+            f"Error details: {_body_preview(datasets_resp, 500) or 'No error details available'}"
+        )
+    
+    datasets_data = json_loads(datasets_resp.content)
+    datasets = datasets_data.get("value", [])
+    
+    if dataset_id:
+        # Use provided dataset ID and validate it exists
+        print(f"[DEBUG] Using provided dataset ID: {dataset_id}")
+        dataset = next((d for d in datasets if d.get("id") == dataset_id), None)  # single pass, no index needed
+        if not dataset:
+            available_ids = [d.get("id", "Unknown") for d in datasets]
+            raise RuntimeError(
+                f"Dataset ID '{dataset_id}' not found in workspace '{workspace_name}'. "
+                f"Available dataset IDs: {', '.join(sorted(available_ids))}"
+            )
+    else:
+        # Resolve dataset by name
+        print(f"[DEBUG] Resolving dataset by name: '{dataset_name}'...")
+        datasets_by_name, datasets_by_lower_name = _index_by_name(datasets)
+        dataset = datasets_by_name.get(dataset_name)
+        
+        # Fallback to case-insensitive lookup
+        if not dataset:
+            print(f"[DEBUG] Exact dataset name match not found, trying case-insensitive search...")
+            dataset = datasets_by_lower_name.get(dataset_name.lower())
+        
+        if not dataset:
+            available_datasets = [d.get("name", "Unknown") for d in datasets]
+            raise RuntimeError(
+                f"Dataset '{dataset_name}' not found in workspace '{workspace_name}'. "
+                f"Available datasets: {', '.join(sorted(available_datasets))}"
+            )
+        
+        dataset_id = dataset.get("id")
+
+    print(f"[DEBUG] Found dataset '{dataset_name}' with ID: {dataset_id}")
+    
+    return workspace_id, dataset_id
+
+def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str, workspace_connection: str, dataset_name: str, dax_query: str, dataset_id: Optional[str] = None, session: Optional[requests.Session] = None) -> List[Dict]:
     """
     Execute a DAX query using the Power BI REST API Execute Queries endpoint.
     
@@ -518,6 +786,7 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
     2. Acquire Azure AD access token for Power BI Service API
     3. Resolve workspace (group) ID by name using Power BI Groups API
     4. Resolve dataset ID by name or use provided dataset ID
+       (steps 3-4 are cached for RESOLVE_CACHE_TTL seconds per workspace/dataset)
     5. Execute DAX query using Power BI Execute Queries API
     6. Parse and return results in standardized format
     
@@ -531,6 +800,8 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
         dax_query (str): Valid DAX expression to execute (typically starts with EVALUATE)
         dataset_id (Optional[str]): Specific dataset ID to use instead of resolving by name.
                                    Improves performance when known.
+        session (Optional[requests.Session]): HTTP session to send the requests on.
+                                   Defaults to the module-wide pooled session.
     
     Returns:
         List[Dict]: Query results as list of dictionaries, where each dictionary represents
@@ -545,6 +816,7 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
     Raises:
         ValueError: When workspace_connection is not a valid powerbi:// URL or cannot be parsed
         RuntimeError: When any step fails:
+                     - Workspace or dataset listing failures
                      - Workspace not found by name
                      - Dataset not found by name or ID
                      - DAX execution errors
@@ -566,6 +838,7 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
         - REST API execution is optimized for Power BI Premium workspaces
         - Response includes null values when serializerSettings.includeNulls is true
         - Timeout set to 120 seconds for long-running DAX queries
+        - HTTPS connections are pooled and reused across calls
         - Case-insensitive fallback for workspace and dataset name resolution
     
     Example Usage:
@@ -601,108 +874,84 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
     print("[DEBUG] Acquiring Azure AD access token for Power BI Service API...")
     token = get_access_token(tenant_id, client_id, client_secret)
     
-    # Set up HTTP session with authentication headers
-    session = requests.Session()
+    # Reuse pooled keep-alive connections for all three REST calls
+    session = session or _SHARED_SESSION
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
     }
 
-    # Step 1: Resolve workspace (group) ID by name
-    print(f"[DEBUG] Resolving workspace ID for workspace: '{workspace_name}'...")
-    groups_url = "https://api.powerbi.com/v1.0/myorg/groups"
-    resp = session.get(groups_url, headers=headers, timeout=60)
-    resp.raise_for_status()
-    
-    groups_data = resp.json()
-    groups = groups_data.get("value", [])
-    
-    # Find workspace by exact name match
-    workspace = next((g for g in groups if g.get("name") == workspace_name), None)
-    
-    # Fallback to case-insensitive search if exact match not found
-    if not workspace:
-        print(f"[DEBUG] Exact match not found, trying case-insensitive search...")
-        workspace = next(
-            (g for g in groups if str(g.get("name", "")).lower() == workspace_name.lower()), 
-            None
-        )
-    
-    if not workspace:
-        available_workspaces = [g.get("name", "Unknown") for g in groups]
-        raise RuntimeError(
-            f"Workspace '{workspace_name}' not found. "
-            f"Available workspaces: {', '.join(sorted(available_workspaces))}"
-        )
-    
-    workspace_id = workspace.get("id")
-    print(f"[DEBUG] Found workspace '{workspace_name}' with ID: {workspace_id}")
-
-    # Step 2: Resolve dataset ID by name or use provided ID
-    print(f"[DEBUG] Resolving dataset in workspace '{workspace_name}'...")
-    datasets_url = f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets"
-    datasets_resp = session.get(datasets_url, headers=headers, timeout=60)
-    datasets_resp.raise_for_status()
-    
-    datasets_data = datasets_resp.json()
-    datasets = datasets_data.get("value", [])
-    
-    if dataset_id:
-        # Use provided dataset ID and validate it exists
-        print(f"[DEBUG] Using provided dataset ID: {dataset_id}")
-        dataset = next((d for d in datasets if d.get("id") == dataset_id), None)
-        if not dataset:
-            available_ids = [d.get("id", "Unknown") for d in datasets]
-            raise RuntimeError(
-                f"Dataset ID '{dataset_id}' not found in workspace '{workspace_name}'. "
-                f"Available dataset IDs: {', '.join(sorted(available_ids))}"
-            )
+    # Steps 1-2: Resolve workspace (group) and dataset IDs, reusing a recent lookup.
+    # Names and IDs rarely change, so this skips two listing calls per query.
+    cache_key = (tenant_id, workspace_connection.lower(), dataset_name or "", dataset_id)
+    cached = _RESOLVE_CACHE.get(cache_key)
+    if cached and time.monotonic() - cached[2] < RESOLVE_CACHE_TTL:
+        workspace_id, resolved_dataset_id = cached[0], cached[1]
+        from_cache = True
+        print(f"[DEBUG] Using cached workspace ID {workspace_id} and dataset ID {resolved_dataset_id}")
     else:
-        # Resolve dataset by name
-        print(f"[DEBUG] Resolving dataset by name: '{dataset_name}'...")
-        dataset = next((d for d in datasets if d.get("name") == dataset_name), None)
-        
-        # Fallback to case-insensitive search
-        if not dataset:
-            print(f"[DEBUG] Exact dataset name match not found, trying case-insensitive search...")
-            dataset = next(
-                (d for d in datasets if str(d.get("name", "")).lower() == dataset_name.lower()), 
-                None
-            )
-        
-        if not dataset:
-            available_datasets = [d.get("name", "Unknown") for d in datasets]
-            raise RuntimeError(
-                f"Dataset '{dataset_name}' not found in workspace '{workspace_name}'. "
-                f"Available datasets: {', '.join(sorted(available_datasets))}"
-            )
-        
-        dataset_id = dataset.get("id")
-
-    print(f"[DEBUG] Found dataset '{dataset_name}' with ID: {dataset_id}")
+        workspace_id, resolved_dataset_id = _resolve_workspace_and_dataset(
+            session, headers, workspace_name, dataset_name, dataset_id
+        )
+        _RESOLVE_CACHE[cache_key] = (workspace_id, resolved_dataset_id, time.monotonic())
+        from_cache = False
     
     # Step 3: Execute DAX query using Power BI Execute Queries API
-    execute_url = f"https://api.powerbi.com/v1.0/myorg/datasets/{dataset_id}/executeQueries"
-    print(f"[DEBUG] Executing DAX query via REST API: {execute_url}")
     print(f"[DEBUG] DAX query: {dax_query[:200]}...")
     
-    # Prepare request payload with query and serializer settings
-    payload = {
+    # Prepare request payload with query and serializer settings, serialized once
+    payload = json_dumps({
         "queries": [{"query": dax_query}],
         "serializerSettings": {"includeNulls": True}  # Include null values in results
-    }
+    })
+    
+    execute_url = f"https://api.powerbi.com/v1.0/myorg/datasets/{resolved_dataset_id}/executeQueries"
+    print(f"[DEBUG] Executing DAX query via REST API: {execute_url}")
     
     # Execute the DAX query with extended timeout for complex queries
     execute_resp = session.post(
         execute_url, 
         headers=headers, 
-        data=json.dumps(payload), 
+        data=payload, 
         timeout=120  # Extended timeout for complex DAX queries
     )
     
+    # A 401 means the token was rejected (expired or revoked early): force a
+    # fresh token and retry once with the same IDs
+    if execute_resp.status_code == 401:
+        print("[DEBUG] HTTP 401 from Execute Queries API, refreshing the access token...")
+        token_result = _acquire_cached_token(tenant_id, client_id, client_secret, force_refresh=True)
+        if not token_result or "access_token" not in token_result:
+            raise RuntimeError(f"Failed to refresh Azure AD token after HTTP 401. Details: {token_result}")
+        headers["Authorization"] = f"Bearer {token_result['access_token']}"
+        execute_resp = session.post(
+            execute_url, 
+            headers=headers, 
+            data=payload, 
+            timeout=120
+        )
+    
+    # A 404 with a cached ID means the dataset was recreated or moved: drop
+    # the lookup, resolve again and retry once
+    if from_cache and execute_resp.status_code == 404:
+        print("[DEBUG] HTTP 404 with cached IDs, re-resolving workspace and dataset...")
+        _RESOLVE_CACHE.pop(cache_key, None)
+        workspace_id, resolved_dataset_id = _resolve_workspace_and_dataset(
+            session, headers, workspace_name, dataset_name, dataset_id
+        )
+        _RESOLVE_CACHE[cache_key] = (workspace_id, resolved_dataset_id, time.monotonic())
+        
+        execute_url = f"https://api.powerbi.com/v1.0/myorg/datasets/{resolved_dataset_id}/executeQueries"
+        execute_resp = session.post(
+            execute_url, 
+            headers=headers, 
+            data=payload, 
+            timeout=120
+        )
+    
     # Handle execution errors
     if execute_resp.status_code >= 400:
-        error_detail = execute_resp.text[:500] if execute_resp.text else "No error details available"
+        error_detail = _body_preview(execute_resp, 500) or "No error details available"
         raise RuntimeError(
             f"Power BI Execute Queries API failed with HTTP {execute_resp.status_code}. "
             f"Error details: {error_detail}"
@@ -710,7 +959,7 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
     
     # Step 4: Parse and return query results
     try:
-        response_data = execute_resp.json()
+        response_data = json_loads(execute_resp.content)
         print(f"[DEBUG] Successfully executed DAX query via REST API")
         
         # Extract results from API response structure
@@ -739,7 +988,7 @@ def rest_execute_dax_via_api(tenant_id: str, client_id: str, client_secret: str,
         )
 
 
-def parse_xmla_response(xml_text: str) -> List[Dict]:
+def parse_xmla_response(xml_text: Union[str, bytes]) -> List[Dict]:
     """
     Parse XMLA SOAP response XML and extract tabular data as list of dictionaries.
     
@@ -761,8 +1010,9 @@ def parse_xmla_response(xml_text: str) -> List[Dict]:
     - x: Rowset/tabular data namespace
     
     Args:
-        xml_text (str): Raw XML response text from XMLA SOAP Execute request.
-                       Should be complete, well-formed XML document.
+        xml_text (Union[str, bytes]): Raw XML response from XMLA SOAP Execute request.
+                       Should be complete, well-formed XML document. Pass the
+                       response bytes (resp.content) to skip decoding the body.
     
     Returns:
         List[Dict]: List of row dictionaries where each dictionary represents one row
@@ -778,6 +1028,7 @@ def parse_xmla_response(xml_text: str) -> List[Dict]:
     
     Raises:
         xml.etree.ElementTree.ParseError: When XML is malformed or cannot be parsed
+                                          (lxml.etree.XMLSyntaxError when lxml is installed)
         Exception: For other parsing errors (namespace issues, unexpected structure)
     
     XML Structure Expected:
@@ -803,10 +1054,11 @@ def parse_xmla_response(xml_text: str) -> List[Dict]:
         ```
     
     Performance Notes:
-        - Uses ElementTree for efficient XML parsing
+        - Streams the document with iterparse (lxml when available, else ElementTree)
+        - Each row element is cleared once extracted, so the parsed tree never
+          holds more than one populated row
         - Namespace-aware parsing for robust extraction
         - Handles missing or null values (empty strings)
-        - Memory efficient for large result sets
     
     Example Usage:
         >>> xml_response = '''<soap:Envelope...>...</soap:Envelope>'''
@@ -814,50 +1066,55 @@ def parse_xmla_response(xml_text: str) -> List[Dict]:
         >>> for row in rows:
         ...     print(f"Customer: {row['CustomerName']}, Sales: {row['TotalSales']}")
     """
-    # Define XML namespaces used in XMLA SOAP responses
-    namespaces = {
-        'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
-        'xmla': 'urn:schemas-microsoft-com:xml-analysis',
-        'm': 'urn:schemas-microsoft-com:xml-analysis:mddataset',
-        'x': 'urn:schemas-microsoft-com:xml-analysis:rowset',
-    }
+    # iterparse reads from a byte stream; encode text input once up front
+    xml_bytes = xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text
+    
+    # Qualified column tag -> bare column name, filled as columns are first seen
+    # so each distinct tag is stripped once rather than once per cell
+    column_names: Dict[str, str] = {}
     
     try:
-        # Parse the XML response
-        root = ET.fromstring(xml_text)
-        
-        # Find all row elements using XPath with namespace prefixes
-        # This searches through the entire document structure for row elements
-        row_elements = root.findall('.//x:row', namespaces)
-        
-        # Convert each XML row element to a dictionary
+        # Stream the XML response, handling each rowset row as soon as it closes
         results: List[Dict] = []
-        for row_element in row_elements:
+        for _, row_element in _row_parser.iterparse(io.BytesIO(xml_bytes), events=("end",)):
+            if row_element.tag != XMLA_ROW_TAG:
+                continue
+            
             # Create dictionary from row element children
             row_data = {}
             for child in row_element:
                 # Extract column name (removing namespace prefix if present)
-                column_name = child.tag.split('}', 1)[-1]  # Remove namespace prefix
+                tag = child.tag
+                column_name = column_names.get(tag)
+                if column_name is None:
+                    if tag.startswith(XMLA_ROWSET_NS):
+                        column_name = tag[len(XMLA_ROWSET_NS):]
+                    else:
+                        column_name = tag.rsplit('}', 1)[-1]
+                    column_names[tag] = column_name
                 # Extract column value (handle None as empty string)
                 column_value = child.text or ""
                 row_data[column_name] = column_value
             
             results.append(row_data)
+            
+            # Release the row's children now that they've been copied out
+            row_element.clear()
         
         print(f"[DEBUG] Parsed {len(results)} rows from XMLA response")
         return results
         
-    except ET.ParseError as e:
+    except _XML_PARSE_ERRORS as e:
         print(f"[ERROR] XML parsing error in XMLA response: {e}")
-        print(f"[ERROR] XML content preview: {xml_text[:500]}...")
+        print(f"[ERROR] XML content preview: {xml_bytes[:500].decode('utf-8', errors='replace')}...")
         raise
     except Exception as e:
         print(f"[ERROR] Unexpected error parsing XMLA response: {e}")
-        print(f"[ERROR] XML content preview: {xml_text[:500]}...")
+        print(f"[ERROR] XML content preview: {xml_bytes[:500].decode('utf-8', errors='replace')}...")
         raise
 
 
-def try_parse_soap_fault(xml_text: str) -> Optional[str]:
+def try_parse_soap_fault(xml_text: Union[str, bytes]) -> Optional[str]:
     """
     Extract SOAP fault information from XMLA error responses for detailed error reporting.
     
@@ -871,8 +1128,9 @@ def try_parse_soap_fault(xml_text: str) -> Optional[str]:
     - detail: Additional error-specific information (optional)
     
     Args:
-        xml_text (str): Raw XML response text that may contain a SOAP fault.
+        xml_text (Union[str, bytes]): Raw XML response that may contain a SOAP fault.
                        Typically received when HTTP status indicates an error.
+                       Pass resp.content to parse the bytes without decoding them first.
     
     Returns:
         Optional[str]: Formatted fault message combining fault code and description,
@@ -966,7 +1224,8 @@ def is_transient_status(status_code: Optional[int]) -> bool:
         - None: Network failures, connection timeouts
         - 408: Request Timeout
         - 429: Too Many Requests (rate limiting)
-        - 500-599: Server errors (internal errors, service unavailable, etc.)
+        - 500-599: Server errors (internal errors, 503 service unavailable,
+                   524 gateway timeout on long-running queries, etc.)
     
     Non-Transient Status Codes (Not Retryable):
         - 400: Bad Request (invalid DAX syntax, malformed request)
@@ -1224,6 +1483,43 @@ def execute_dax_via_http(dax_query: str) -> List[Dict]:
         return client.execute_dax(dax_query)
 
 
+def execute_many_dax(queries: List[str], max_workers: int = 4) -> List[List[Dict]]:
+    """
+    Execute several independent DAX queries concurrently using environment configuration.
+    
+    Each query goes through execute_dax_via_http() on a worker thread. The workers
+    share the pooled HTTPS session, the cached access token and the cached
+    workspace/dataset IDs, so after the first query each one is a single request
+    and their network waits overlap instead of adding up. Power BI accepts
+    multiple concurrent executeQueries calls against the same dataset.
+    
+    Args:
+        queries (List[str]): DAX statements to execute (typically starting with EVALUATE)
+        max_workers (int): Maximum number of queries in flight at once (default: 4).
+                          Keep this modest to stay under Power BI's per-user query limits.
+    
+    Returns:
+        List[List[Dict]]: One result row list per query, in the same order as queries.
+    
+    Raises:
+        ValueError: When required environment variables are missing
+        RuntimeError: The first failure encountered, in query order
+    
+    Example Usage:
+        >>> results = execute_many_dax([
+        ...     "EVALUATE TOPN(5, 'Sales')",
+        ...     "EVALUATE ROW(\"Customers\", COUNTROWS('Customer'))",
+        ... ])
+        >>> sales_rows, customer_rows = results
+    """
+    if not queries:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+        # map() preserves input order and re-raises the first failing query's exception
+        return list(executor.map(execute_dax_via_http, queries))
+
+
 def health_check() -> bool:
     """
     Perform a simple connectivity and authentication health check using a model-agnostic DAX query.